@@ -0,0 +1,267 @@
+import cv2
+import numpy as np
+import os
+import stage_timing
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from notify_server import CHAT_ID, notify_server, notify_server_images, notify_server_video
+
+load_dotenv()
+
+CAMERA_NAME = os.getenv("CAMERA_NAME", "default")
+# The first detection after a quiet spell is sent at once; later ones within
+# ALERT_WINDOW seconds are collected and sent together as one album
+ALERT_WINDOW = float(os.getenv("ALERT_WINDOW", "60"))  # 0 sends every snapshot on its own
+ALERT_MAX_SNAPSHOTS = int(os.getenv("ALERT_MAX_SNAPSHOTS", "4"))  # Per album; a full album goes early
+# Messages per minute and burst per chat, shared by snapshots and clips; 0 = unlimited.
+# This process paces itself with them; the dashboard's /api/detect-human routes
+# (security-dashboard/lib/rate-limit.ts) enforce the same limit across every
+# camera process sending to the chat
+ALERT_RATE = float(os.getenv("ALERT_RATE", "6"))
+ALERT_BURST = float(os.getenv("ALERT_BURST", "3"))
+# Snapshots whose difference hash is within this many bits of one already in
+# the open album (or sent when it opened) are counted but not uploaded
+ALERT_DEDUP_DISTANCE = int(os.getenv("ALERT_DEDUP_DISTANCE", "6"))
+MAX_ALBUM = 10  # Telegram's limit for one media group
+
+
+def dhash(image):
+    """64-bit difference hash: the brightness gradients of a 9x8 thumbnail."""
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def crop(frame, boxes):
+    """The part of `frame` covering every (x1, y1, x2, y2) box, or the whole frame."""
+    if not boxes:
+        return frame
+    h, w = frame.shape[:2]
+    x1 = max(0, int(min(box[0] for box in boxes)))
+    y1 = max(0, int(min(box[1] for box in boxes)))
+    x2 = min(w, int(max(box[2] for box in boxes)))
+    y2 = min(h, int(max(box[3] for box in boxes)))
+    if x2 - x1 < 2 or y2 - y1 < 2:
+        return frame
+    return frame[y1:y2, x1:x2]
+
+
+class TokenBucket:
+    """`rate` messages per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.time()
+
+    def wait_time(self, now):
+        """Seconds until a token is available."""
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        """Take a token if one is available now."""
+        if self.wait_time(now) > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    def reserve(self, now):
+        """Take a token now or, going into debt, in the future; returns the wait."""
+        wait = self.wait_time(now)
+        if self.rate > 0:
+            self.tokens -= 1
+        return wait
+
+
+class Batch:
+    """Detections of one camera waiting to be sent together."""
+
+    def __init__(self, now, window):
+        self.deadline = now + window
+        self.first = self.last = None
+        self.events = 0
+        self.snapshots = []  # Saved JPEG paths
+        self.hashes = []  # Of the snapshots above and the one sent when it opened
+        self.cover = None  # (frame, path) of a duplicate, sent if nothing new turns up
+
+
+class AlertAggregator:
+    """Coalesce detection alerts per camera and rate-limit them per chat.
+
+    `add()` is called for every detection event. After a quiet spell the
+    first snapshot goes out immediately, so alerts are never slower than
+    before; the camera's next events are collected for `window` seconds and
+    sent as one album with a caption counting every event. Snapshots that
+    look like one already in the album (by difference hash of the detected
+    region) are counted but not uploaded; an album of nothing but duplicates
+    still goes out with one of them, so every event is reported. When the
+    chat's token bucket is empty the album is held back and keeps collecting
+    events instead, so the rate limit delays alerts but never drops them.
+    """
+
+    def __init__(
+        self,
+        camera=CAMERA_NAME,
+        chat_id=CHAT_ID,
+        window=ALERT_WINDOW,
+        max_snapshots=ALERT_MAX_SNAPSHOTS,
+        dedup_distance=ALERT_DEDUP_DISTANCE,
+        bucket=None,
+    ):
+        self.camera = camera
+        self.chat_id = chat_id
+        self.window = window
+        self.max_snapshots = min(MAX_ALBUM, max(1, max_snapshots))
+        self.dedup_distance = dedup_distance
+        self.bucket = bucket or get_bucket(chat_id)
+        self.condition = threading.Condition()
+        self.batch = None
+
+        # Stats
+        self.events = 0
+        self.duplicates = 0
+        self.messages = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, frame, image_path, boxes=None):
+        """Record one detection; `frame` is saved to `image_path` only if it is uploaded."""
+        now = time.time()
+        image_hash = dhash(crop(frame, boxes))
+        stage_timing.count("alert_events")
+        with self.condition:
+            self.events += 1
+            if self.window <= 0:
+                self._send_one(self._save(frame, image_path), delay=self.bucket.reserve(now))
+                return
+            if self.batch is None:
+                # Later events of this camera join an album for `window` seconds
+                self.batch = Batch(now, self.window)
+                if self.bucket.take(now):
+                    self.batch.hashes.append(image_hash)
+                    self._send_one(self._save(frame, image_path))
+                    return
+
+            batch = self.batch
+            batch.events += 1
+            batch.first = batch.first or now
+            batch.last = now
+            if any(hamming(image_hash, h) <= self.dedup_distance for h in batch.hashes):
+                self.duplicates += 1
+                stage_timing.count("alert_duplicates")
+                if not batch.snapshots:
+                    batch.cover = (frame.copy(), image_path)
+                return
+            batch.hashes.append(image_hash)
+            if len(batch.snapshots) < self.max_snapshots:
+                batch.snapshots.append(self._save(frame, image_path))
+                if len(batch.snapshots) == self.max_snapshots:
+                    self.condition.notify()  # Send a full album early
+
+    def _save(self, frame, image_path):
+        # Events within one second get the same timestamped filename
+        root, ext = os.path.splitext(image_path)
+        index = 1
+        while os.path.exists(image_path):
+            image_path = f"{root}_{index}{ext}"
+            index += 1
+        cv2.imwrite(image_path, frame)
+        return image_path
+
+    def _send_one(self, image_path, delay=0.0):
+        self.messages += 1
+        notify_server(image_path, delay=delay)
+        print(f"[{datetime.now()}] Alert sent for {self.camera}: {image_path}")
+
+    def _flush(self, now):
+        """Send the open album if it is due and the chat has a token; returns the next wake-up."""
+        batch = self.batch
+        full = len(batch.snapshots) >= self.max_snapshots
+        if now < batch.deadline and not full:
+            return batch.deadline
+        if not batch.snapshots and batch.cover is None:
+            # No events since the snapshot sent when the album opened
+            self.batch = None
+            return None
+        wait = self.bucket.wait_time(now)
+        if wait > 0:
+            return now + wait
+        self.bucket.take(now)
+        if not batch.snapshots:
+            # Only duplicates: still report how many detections there were
+            batch.snapshots.append(self._save(*batch.cover))
+        self.messages += 1
+        notify_server_images(batch.snapshots, batch.events, batch.first, batch.last, self.camera)
+        stage_timing.count("alert_batched", batch.events)
+        print(
+            f"[{datetime.now()}] Alert album sent for {self.camera}: {batch.events} detection(s), "
+            f"{len(batch.snapshots)} snapshot(s)"
+        )
+        # Keep coalescing while detections continue
+        self.batch = Batch(now, self.window) if full else None
+        return self.batch.deadline if self.batch else None
+
+    def _run(self):
+        with self.condition:
+            while True:
+                wake = self._flush(time.time()) if self.batch is not None else None
+                self.condition.wait(timeout=max(0.0, wake - time.time()) if wake else 1.0)
+
+    def send_video(self, video_path):
+        """Queue a finished clip, scheduled after the chat's earlier messages."""
+        with self.condition:
+            delay = self.bucket.reserve(time.time())
+            self.messages += 1
+        if delay > 0:
+            print(f"[{datetime.now()}] Alert rate limit: clip {video_path} goes out in {delay:.0f} s")
+        notify_server_video(video_path, delay=delay)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "events": self.events,
+                "duplicates": self.duplicates,
+                "messages": self.messages,
+                "pending": self.batch.events if self.batch else 0,
+            }
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def get_bucket(chat_id):
+    """The token bucket of a chat, shared by everything this process sends it.
+
+    Other camera processes have their own; the dashboard answers 429 with a
+    Retry-After once the chat's combined limit is reached, and the outbox
+    retries then.
+    """
+    with _buckets_lock:
+        if chat_id not in _buckets:
+            _buckets[chat_id] = TokenBucket(ALERT_RATE / 60, ALERT_BURST)
+        return _buckets[chat_id]
+
+
+def get_aggregator():
+    """Return this process's alert aggregator, starting it on first use."""
+    global _aggregator
+    with _aggregator_lock:
+        if _aggregator is None:
+            _aggregator = AlertAggregator()
+        return _aggregator
@@ -0,0 +1,255 @@
+import atexit
+import cv2
+import metrics
+import os
+import queue
+import recording_catalog
+import stage_timing
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WRITER_QUEUE_SIZE = int(os.getenv("WRITER_QUEUE_SIZE", "120"))  # Frames, ~6 s at 20 fps
+# What to do when the queue is full: "drop-newest" discards the incoming
+# frame, "drop-oldest" discards the oldest queued one, "block" waits
+WRITER_DROP_POLICY = os.getenv("WRITER_DROP_POLICY", "drop-newest")
+WRITER_FSYNC_SECONDS = float(os.getenv("WRITER_FSYNC_SECONDS", "5"))  # 0 disables fsync
+DROP_POLICIES = ("drop-newest", "drop-oldest", "block")
+SEEK_INTERVAL = 1.0  # Seconds between catalogued seek points when ffprobe is unavailable
+GAP_FRAMES = 1.5  # Frame intervals between two written frames that count as a gap
+
+_CLOSE = object()  # Queue sentinel
+_open_writers = set()
+_lock = threading.Lock()
+_metrics = {
+    "written": 0,
+    "dropped": 0,
+    "fsyncs": 0,
+    "max_depth": 0,
+    "write_total": 0.0,
+    "write_max": 0.0,
+}
+
+
+class AsyncVideoWriter:
+    """`cv2.VideoWriter` that encodes and writes on its own thread.
+
+    `write()` only puts the frame on a bounded queue, so a slow or stalled disk
+    never holds up the capture loop; when the queue is full the drop policy
+    decides which frame is lost. Written data is fsynced in batches every
+    `WRITER_FSYNC_SECONDS`. `release()` returns at once unless `wait=True`;
+    `on_close` runs on the writer thread once the file is complete, which is
+    the earliest point it is safe to upload or inspect. Writers given a `kind`
+    add the finished file to the recording catalog.
+    """
+
+    def __init__(
+        self,
+        filename,
+        fourcc,
+        fps,
+        size,
+        queue_size=WRITER_QUEUE_SIZE,
+        drop_policy=WRITER_DROP_POLICY,
+        fsync_seconds=WRITER_FSYNC_SECONDS,
+        kind=None,
+    ):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}'. Choose from: {', '.join(DROP_POLICIES)}")
+        self.filename = filename
+        self.fps = fps
+        self.kind = kind
+        self.drop_policy = drop_policy
+        self.fsync_seconds = fsync_seconds
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.writer = cv2.VideoWriter(filename, fourcc, fps, size)
+        self.on_close = None
+        self.closed = False
+        self.frames = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.seek_points = []
+        # Frames play at a fixed `fps`, but arrive thinned or with drops: these
+        # (wall offset, media time) points map capture time to file position
+        self.timeline = []
+        self.done = threading.Event()
+        with _lock:
+            _open_writers.add(self)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def write(self, frame, timestamp=None, block=False):
+        """Queue a frame captured at `timestamp`; returns False if a frame was dropped.
+
+        `block=True` waits for room whatever the drop policy, for bursts such as
+        a pre-roll that must not push out the frames queued after them.
+        """
+        if self.closed:
+            return False
+        item = (frame, timestamp or time.time())
+        if block or self.drop_policy == "block":
+            self.queue.put(item)
+            return self._track_depth()
+        try:
+            self.queue.put_nowait(item)
+            return self._track_depth()
+        except queue.Full:
+            pass
+        if self.drop_policy == "drop-oldest":
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                pass
+        with _lock:
+            _metrics["dropped"] += 1
+        stage_timing.count("writer_dropped")
+        return False
+
+    def _track_depth(self):
+        depth = self.queue.qsize()
+        with _lock:
+            _metrics["max_depth"] = max(_metrics["max_depth"], depth)
+        return True
+
+    def release(self, on_close=None, wait=False):
+        """Finish the file after the queued frames; `on_close(filename)` runs after."""
+        if not self.closed:
+            self.closed = True
+            self.on_close = on_close
+            # The sentinel must not be dropped, so this put may block briefly
+            self.queue.put(_CLOSE)
+        if wait:
+            self.done.wait()
+
+    def _fsync(self):
+        try:
+            fd = os.open(self.filename, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+            with _lock:
+                _metrics["fsyncs"] += 1
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _run(self):
+        last_sync = time.time()
+        while True:
+            item = self.queue.get()
+            if item is _CLOSE:
+                break
+            frame, timestamp = item
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+            self._track_timeline(timestamp - self.first_timestamp)
+            self.frames += 1
+            self.last_timestamp = timestamp
+            start = time.time()
+            self.writer.write(frame)
+            elapsed = time.time() - start
+            stage_timing.record("encode", elapsed)
+            with _lock:
+                _metrics["written"] += 1
+                _metrics["write_total"] += elapsed
+                _metrics["write_max"] = max(_metrics["write_max"], elapsed)
+            if self.fsync_seconds > 0 and time.time() - last_sync >= self.fsync_seconds:
+                self._fsync()
+                last_sync = time.time()
+
+        self.writer.release()
+        if self.fsync_seconds > 0:
+            self._fsync()
+        with _lock:
+            _open_writers.discard(self)
+        if self.kind is not None and self.frames:
+            try:
+                self._catalog()
+            except Exception as e:
+                print(f"Error cataloguing {self.filename}: {e}")
+        try:
+            if self.on_close is not None:
+                self.on_close(self.filename)
+        except Exception as e:
+            print(f"Error after closing {self.filename}: {e}")
+        finally:
+            self.done.set()
+
+    def _track_timeline(self, offset):
+        media = self.frames / self.fps
+        previous = (self.last_timestamp - self.first_timestamp) if self.frames else None
+        gap = previous is not None and offset - previous > GAP_FRAMES / self.fps
+        if gap and self.timeline[-1][1] < (self.frames - 1) / self.fps:
+            # Close the evenly spaced run at the frame before the gap
+            self.timeline.append((round(previous, 3), round((self.frames - 1) / self.fps, 3)))
+        if not self.timeline or gap or offset - self.timeline[-1][0] >= SEEK_INTERVAL:
+            self.timeline.append((round(offset, 3), round(media, 3)))
+        if not self.seek_points or media - self.seek_points[-1] >= SEEK_INTERVAL:
+            self.seek_points.append(round(media, 3))
+
+    def _catalog(self):
+        # Real keyframe offsets when ffprobe is available, else the seek points
+        probed = recording_catalog.probe(self.filename)
+        frames, keyframes = probed if probed else (self.frames, self.seek_points)
+        recording_catalog.add(
+            self.filename,
+            self.kind,
+            self.first_timestamp,
+            self.last_timestamp + 1.0 / self.fps,
+            frames,
+            keyframes,
+            timeline=self.timeline,
+        )
+
+
+def stats():
+    """Counters for every writer in this process, plus current queue depths."""
+    with _lock:
+        values = dict(_metrics)
+        depth = sum(writer.queue.qsize() for writer in _open_writers)
+        open_writers = len(_open_writers)
+    written = values["written"]
+    return {
+        "open": open_writers,
+        "queue_depth": depth,
+        "max_queue_depth": values["max_depth"],
+        "written": written,
+        "dropped": values["dropped"],
+        "fsyncs": values["fsyncs"],
+        "avg_write_ms": values["write_total"] / written * 1000 if written else 0.0,
+        "max_write_ms": values["write_max"] * 1000,
+    }
+
+
+def format_stats():
+    s = stats()
+    return (
+        f"Writer: {s['open']} open, queue {s['queue_depth']} (max {s['max_queue_depth']}), "
+        f"{s['written']} written, {s['dropped']} dropped, "
+        f"write avg {s['avg_write_ms']:.1f} ms / max {s['max_write_ms']:.1f} ms, "
+        f"{s['fsyncs']} fsyncs"
+    )
+
+
+metrics.gauge("writer_queue_depth", "Frames waiting in video writer queues", lambda: stats()["queue_depth"])
+metrics.gauge("writer_open", "Video files being written", lambda: stats()["open"])
+
+
+@atexit.register
+def _flush_open_writers():
+    # Finish files still open at interpreter exit instead of leaving them truncated
+    with _lock:
+        writers = list(_open_writers)
+    for writer in writers:
+        writer.release(wait=True)
@@ -0,0 +1,107 @@
+import cv2
+import numpy as np
+from abc import ABC, abstractmethod
+import os
+import time
+from dotenv import load_dotenv
+from scheduler import INPUT_SIZES
+
+load_dotenv()
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+PROTOTXT = os.path.join(MODEL_DIR, "MobileNetSSD_deploy.prototxt.txt")
+CAFFEMODEL = os.path.join(MODEL_DIR, "MobileNetSSD_deploy.caffemodel")
+
+# Backend selection; opencv is the only one until another model format ships
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "opencv")
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))  # 0 = library default
+OPENCV_DNN_BACKEND = os.getenv("OPENCV_DNN_BACKEND", "opencv")
+OPENCV_DNN_TARGET = os.getenv("OPENCV_DNN_TARGET", "cpu")
+WARMUP_RUNS = 3
+WARMUP_BATCH = 2  # ROI and multi-camera passes stack several images in one blob
+
+_OPENCV_BACKENDS = {
+    "default": cv2.dnn.DNN_BACKEND_DEFAULT,
+    "opencv": cv2.dnn.DNN_BACKEND_OPENCV,
+    "openvino": cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE,
+}
+_OPENCV_TARGETS = {
+    "cpu": cv2.dnn.DNN_TARGET_CPU,
+    "opencl": cv2.dnn.DNN_TARGET_OPENCL,
+    "opencl_fp16": cv2.dnn.DNN_TARGET_OPENCL_FP16,
+}
+
+
+class InferenceBackend(ABC):
+    """Common interface: `setInput(blob)` then `forward()`, like `cv2.dnn.Net`.
+
+    Every backend returns the SSD detection tensor of shape [1, 1, N, 7], so
+    the rest of the pipeline does not care which one is in use.
+    """
+
+    name = "base"
+
+    def setInput(self, blob):
+        self.blob = blob
+
+    @abstractmethod
+    def forward(self):
+        """Run the net on the last input; returns the [1, 1, N, 7] detections."""
+
+    def warmup(self, runs=WARMUP_RUNS, sizes=INPUT_SIZES, batch=WARMUP_BATCH):
+        """Run dummy passes at every input size the scheduler can pick and at a
+        batched shape, so no real frame pays for a first-time shape; returns
+        the mean seconds per pass."""
+        shapes = [(1, size) for size in sizes] + [(batch, sizes[0])]
+        start = time.time()
+        for n, size in shapes:
+            blob = np.zeros((n, 3, size, size), dtype=np.float32)
+            for _ in range(runs):
+                self.setInput(blob)
+                self.forward()
+        return (time.time() - start) / max(runs * len(shapes), 1)
+
+
+class OpenCVBackend(InferenceBackend):
+    """Caffe MobileNet-SSD through OpenCV DNN with explicit backend and target."""
+
+    name = "opencv"
+
+    def __init__(self, backend=OPENCV_DNN_BACKEND, target=OPENCV_DNN_TARGET, threads=INFERENCE_THREADS):
+        if not os.path.exists(PROTOTXT) or not os.path.exists(CAFFEMODEL):
+            raise FileNotFoundError("Model files missing")
+        if threads > 0:
+            cv2.setNumThreads(threads)
+        if backend not in _OPENCV_BACKENDS:
+            raise ValueError(
+                f"Unknown OPENCV_DNN_BACKEND '{backend}' (choose from {', '.join(_OPENCV_BACKENDS)})"
+            )
+        if target not in _OPENCV_TARGETS:
+            raise ValueError(
+                f"Unknown OPENCV_DNN_TARGET '{target}' (choose from {', '.join(_OPENCV_TARGETS)})"
+            )
+        self.net = cv2.dnn.readNetFromCaffe(PROTOTXT, CAFFEMODEL)
+        self.net.setPreferableBackend(_OPENCV_BACKENDS[backend])
+        self.net.setPreferableTarget(_OPENCV_TARGETS[target])
+
+    def setInput(self, blob):
+        self.net.setInput(blob)
+
+    def forward(self):
+        return self.net.forward()
+
+
+BACKENDS = {
+    OpenCVBackend.name: OpenCVBackend,
+}
+
+
+def create_backend(name=INFERENCE_BACKEND, warmup=True, **kwargs):
+    """Instantiate the named backend and warm it up."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}' (choose from {', '.join(BACKENDS)})")
+    backend = BACKENDS[name](**kwargs)
+    if warmup:
+        elapsed = backend.warmup()
+        print(f"Inference backend '{name}' ready (warm-up {elapsed * 1000:.1f} ms/run)")
+    return backend
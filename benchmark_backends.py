@@ -0,0 +1,72 @@
+import argparse
+import numpy as np
+import time
+from backends import _OPENCV_TARGETS, BACKENDS, create_backend
+
+
+def percentile(values, pct):
+    return float(np.percentile(values, pct)) * 1000 if values else 0.0
+
+
+def benchmark(name, target, runs, batch, size):
+    """Time `runs` forward passes of `batch` random frames on one backend and target."""
+    label = f"{name}/{target}"
+    try:
+        backend = create_backend(name, target=target)
+    except (FileNotFoundError, ImportError, ValueError) as e:
+        return {"backend": label, "target": target, "error": str(e)}
+
+    rng = np.random.default_rng(0)
+    blob = rng.uniform(-1, 1, (batch, 3, size, size)).astype(np.float32)
+    timings = []
+    start = time.time()
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        backend.setInput(blob)
+        backend.forward()
+        timings.append(time.perf_counter() - t0)
+    total = time.time() - start
+    return {
+        "backend": label,
+        "target": target,
+        "p50_ms": percentile(timings, 50),
+        "p90_ms": percentile(timings, 90),
+        "p99_ms": percentile(timings, 99),
+        "fps": runs * batch / total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the inference backends on this machine")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma-separated backend names")
+    parser.add_argument("--targets", default=",".join(_OPENCV_TARGETS), help="comma-separated OPENCV_DNN_TARGETs")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--size", type=int, default=300)
+    args = parser.parse_args()
+
+    results = [
+        benchmark(name.strip(), target.strip(), args.runs, args.batch, args.size)
+        for name in args.backends.split(",")
+        for target in args.targets.split(",")
+    ]
+
+    print(f"\n{'backend':<20}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'frames/s':>12}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:<20}  skipped: {result['error']}")
+            continue
+        print(
+            f"{result['backend']:<20}{result['p50_ms']:>10.1f}{result['p90_ms']:>10.1f}"
+            f"{result['p99_ms']:>10.1f}{result['fps']:>12.1f}"
+        )
+
+    ranked = [r for r in results if "error" not in r]
+    if ranked:
+        best = max(ranked, key=lambda r: r["fps"])
+        name = best["backend"].split("/")[0]
+        print(f"\nFastest on this machine: INFERENCE_BACKEND={name} OPENCV_DNN_TARGET={best['target']}")
+
+
+if __name__ == "__main__":
+    main()
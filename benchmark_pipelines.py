@@ -0,0 +1,213 @@
+import argparse
+import glob
+import json
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import requests
+from stage_timing import summarize
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_PATH = os.path.join(REPO_DIR, "benchmarks", "results.jsonl")
+# Each pipeline runs in its own process against the fake camera's URL
+PIPELINES = {
+    "human": "import sys, human_detection; human_detection.run_human_detection(sys.argv[1])",
+    "motion": "import sys, motion_detection; motion_detection.main(sys.argv[1])",
+    "continuous": "import sys, continuous_recording; continuous_recording.continuous_recording(sys.argv[1])",
+}
+# Stages compared between runs, in pipeline order
+STAGES = ("read_wait", "motion", "preprocess", "inference", "postprocess", "record", "write", "encode", "latency")
+
+
+def wait_for(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.2)
+    return False
+
+
+def peak_rss_mb(pid):
+    """Peak resident memory of a process (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def collect(timing_dir):
+    """Merge the stage samples dumped by every process of one run."""
+    samples, counters = {}, {}
+    for path in glob.glob(os.path.join(timing_dir, "stage_timing_*.json")):
+        with open(path) as f:
+            dump = json.load(f)
+        for stage, values in dump["stages"].items():
+            samples.setdefault(stage, []).extend(values.get("samples", []))
+        for name, value in dump["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+    return {stage: summarize(values) for stage, values in samples.items()}, counters
+
+
+def run_pipeline(name, url, duration, extra_env):
+    """Run one pipeline for `duration` seconds and measure it."""
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    timing_dir = os.path.join(work_dir, "timing")
+    os.makedirs(timing_dir)
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_DIR,
+        STAGE_TIMING_DIR=timing_dir,
+        INFERENCE_WORKERS="0",
+        **extra_env,
+    )
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+    # Recordings, catalog and outbox land in the scratch directory
+    process = subprocess.Popen(
+        [sys.executable, "-c", PIPELINES[name], url],
+        cwd=work_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(duration)
+        rss = peak_rss_mb(process.pid)
+    finally:
+        # SIGINT lets the pipeline close its writers and dump its samples
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    elapsed = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    stages, counters = collect(timing_dir)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "pipeline": name,
+        "fps": counters.get("frames", 0) / duration,
+        "frames": counters.get("frames", 0),
+        "skipped": counters.get("skipped", 0),
+        "dropped": counters.get("writer_dropped", 0),
+        "cpu_pct": cpu / elapsed * 100,
+        "peak_rss_mb": rss,
+        "stages": stages,
+    }
+
+
+def previous_result(results_path, result):
+    """Most recent saved result for the same pipeline, video and mode."""
+    if not os.path.exists(results_path):
+        return None
+    match = None
+    with open(results_path) as f:
+        for line in f:
+            saved = json.loads(line)
+            if all(saved.get(k) == result[k] for k in ("pipeline", "video", "mode")):
+                match = saved
+    return match
+
+
+def change(new, old):
+    if not old:
+        return ""
+    return f" ({(new - old) / old * 100:+.0f}%)"
+
+
+def print_result(result, previous):
+    old = previous or {}
+    print(
+        f"\n{result['pipeline']}: {result['fps']:.1f} fps{change(result['fps'], old.get('fps'))}, "
+        f"CPU {result['cpu_pct']:.0f}%{change(result['cpu_pct'], old.get('cpu_pct'))}, "
+        f"peak RSS {result['peak_rss_mb']:.0f} MB{change(result['peak_rss_mb'], old.get('peak_rss_mb'))}, "
+        f"{result['skipped']} frames skipped, {result['dropped']} dropped by the writer"
+    )
+    if previous:
+        print(f"  compared with {previous['commit'] or 'unknown commit'} at {previous['time']}")
+    print(f"  {'stage':<12}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    old_stages = old.get("stages", {})
+    for stage in STAGES:
+        if stage not in result["stages"]:
+            continue
+        s = result["stages"][stage]
+        p99_change = change(s["p99_ms"], old_stages.get(stage, {}).get("p99_ms"))
+        print(
+            f"  {stage:<12}{s['count']:>8}{s['p50_ms']:>10.1f}{s['p90_ms']:>10.1f}"
+            f"{s['p99_ms']:>10.1f}{p99_change}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipelines offline against a recorded video served as an MJPEG camera"
+    )
+    parser.add_argument("--video", required=True, help="recorded clip to replay")
+    parser.add_argument("--pipelines", default=",".join(PIPELINES), help="comma-separated pipeline names")
+    parser.add_argument("--mode", choices=["realtime", "fast"], default="realtime",
+                        help="replay at the clip's fps, or as fast as the pipeline reads")
+    parser.add_argument("--duration", type=int, default=60, help="seconds per pipeline")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--label", default="", help="note stored with the results")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSON-lines file results are appended to")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the pipelines, e.g. MOTION_GATE=1")
+    args = parser.parse_args()
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    camera = subprocess.Popen(
+        [
+            sys.executable, os.path.join(REPO_DIR, "fake_camera.py"),
+            "--video", args.video, "--port", str(args.port), "--mode", args.mode,
+        ]
+    )
+    try:
+        if not wait_for(f"http://localhost:{args.port}/"):
+            print("Fake camera did not start")
+            return
+        url = f"http://localhost:{args.port}/video"
+        os.makedirs(os.path.dirname(args.results), exist_ok=True)
+        for name in args.pipelines.split(","):
+            result = run_pipeline(name.strip(), url, args.duration, extra_env)
+            result.update(
+                time=datetime.now().isoformat(timespec="seconds"),
+                commit=git_commit(),
+                label=args.label,
+                video=os.path.basename(args.video),
+                mode=args.mode,
+                duration=args.duration,
+                env=extra_env,
+            )
+            print_result(result, previous_result(args.results, result))
+            with open(args.results, "a") as f:
+                f.write(json.dumps(result) + "\n")
+    finally:
+        camera.terminate()
+        camera.wait()
+
+
+if __name__ == "__main__":
+    main()
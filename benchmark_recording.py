@@ -0,0 +1,102 @@
+import argparse
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("reencode", "adaptive", "passthrough")
+
+
+def directory_bytes(path):
+    return sum(
+        os.path.getsize(os.path.join(path, f))
+        for f in os.listdir(path)
+        if os.path.isfile(os.path.join(path, f))
+    )
+
+
+def benchmark(mode, source, duration, segment):
+    """Record `source` for `duration` seconds in one mode, in a child process."""
+    out_dir = tempfile.mkdtemp(prefix=f"recording_{mode}_")
+    env = dict(
+        os.environ,
+        RECORDING_MODE=mode,
+        VIDEO_URL=source,
+        CONTINUOUS_DIR=out_dir,
+        SEGMENT_DURATION=str(segment),
+    )
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "continuous_recording.py")],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(duration)
+    finally:
+        # SIGINT lets the recorder close its writer (and wait for ffmpeg)
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    elapsed = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    written = directory_bytes(out_dir)
+    segments = len(os.listdir(out_dir))
+    shutil.rmtree(out_dir, ignore_errors=True)
+    return {
+        "mode": mode,
+        "cpu_pct": cpu / elapsed * 100,
+        "mb_written": written / 1024 ** 2,
+        "mb_per_s": written / 1024 ** 2 / elapsed,
+        "segments": segments,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare CPU and disk throughput of the continuous recording modes"
+    )
+    parser.add_argument("--source", default=os.getenv("VIDEO_URL"), help="camera URL (defaults to VIDEO_URL)")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated recording modes")
+    parser.add_argument("--duration", type=int, default=60, help="seconds to record per mode")
+    parser.add_argument("--segment", type=int, default=20, help="SEGMENT_DURATION for the run")
+    args = parser.parse_args()
+    if not args.source:
+        parser.error("no --source given and VIDEO_URL is not set")
+
+    results = [
+        benchmark(mode.strip(), args.source, args.duration, args.segment)
+        for mode in args.modes.split(",")
+    ]
+
+    print(f"\n{'mode':<14}{'CPU %':>8}{'MB written':>12}{'MB/s':>8}{'segments':>10}")
+    for result in results:
+        print(
+            f"{result['mode']:<14}{result['cpu_pct']:>8.1f}{result['mb_written']:>12.1f}"
+            f"{result['mb_per_s']:>8.2f}{result['segments']:>10}"
+        )
+
+    # The real saving of adaptive recording; the recorder's own log only gives
+    # an upper bound. Runs are sequential, so compare them on a steady scene.
+    by_mode = {result["mode"]: result for result in results}
+    if "reencode" in by_mode and "adaptive" in by_mode:
+        full = by_mode["reencode"]["mb_per_s"]
+        adaptive = by_mode["adaptive"]["mb_per_s"]
+        if full > 0:
+            print(
+                f"\nadaptive vs reencode: {(full - adaptive) * 60:.1f} MB/min saved "
+                f"({(full - adaptive) / full * 100:.0f}%)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import cv2
+import os
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from frame_buffer import SHM_PREFIX, open_capture
+
+load_dotenv()
+
+RECONNECT_DELAY = 5  # Seconds to wait before reopening the camera
+NEXT_FRAME_TIMEOUT = 10  # Seconds a subscriber waits before giving up
+IDLE_POLL = 0.1  # Seconds between subscriber checks for idle shared-memory hubs
+# Quality tiers as "name:width:jpeg_quality:max_fps"; 0 keeps the camera's
+# width / frame rate
+LIVE_TIERS = os.getenv("LIVE_TIERS", "high:0:80:0,medium:640:70:10,low:320:50:5")
+DEFAULT_TIER = os.getenv("LIVE_DEFAULT_TIER", "high")
+
+
+def parse_tiers(spec=LIVE_TIERS):
+    """Parse LIVE_TIERS into a list of (name, width, quality, max_fps)."""
+    tiers = []
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        try:
+            name, width, quality, max_fps = part.strip().split(":")
+            tiers.append((name, int(width), int(quality), float(max_fps)))
+        except ValueError:
+            print(f"Ignoring invalid live tier: {part}")
+    return tiers
+
+
+class Tier:
+    """One encoded rendition of a camera, shared by all of its subscribers."""
+
+    def __init__(self, name, width, quality, max_fps):
+        self.name = name
+        self.width = width
+        self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.condition = threading.Condition()
+        self.subscribers = []
+        self.seq = 0
+        self.jpeg = None
+        self.captured_at = 0.0
+        self.last_encode = 0.0
+        self.encoded = 0
+        self.bytes_encoded = 0
+
+    def due(self, now):
+        return self.subscribers and now - self.last_encode >= self.interval
+
+    def encode(self, frame, captured_at):
+        (h, w) = frame.shape[:2]
+        if self.width and w > self.width:
+            frame = cv2.resize(
+                frame, (self.width, int(h * self.width / w)), interpolation=cv2.INTER_AREA
+            )
+        ok, buffer = cv2.imencode(".jpg", frame, self.params)
+        if not ok:
+            return
+        self.last_encode = captured_at
+        self.encoded += 1
+        data = buffer.tobytes()
+        self.bytes_encoded += len(data)
+        with self.condition:
+            self.jpeg = data
+            self.captured_at = captured_at
+            self.seq += 1
+            self.condition.notify_all()
+
+
+class Subscriber:
+    """One viewer of a tier, with its own position, frame-rate cap and lag counters."""
+
+    def __init__(self, hub, tier, max_fps=0):
+        self.hub = hub
+        self.tier = tier
+        self.interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.last_seq = tier.seq
+        self.last_sent = 0.0
+        self.connected_at = time.time()
+        self.sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.lag_frames = 0
+        self.lag_ms = 0.0
+
+    def next_frame(self, timeout=NEXT_FRAME_TIMEOUT):
+        """Block until a newer encoded frame than the last one sent is available.
+
+        Slow clients simply get the newest frame; everything they missed in
+        between is counted as dropped and never queued.
+        """
+        if self.interval:
+            # Per-client frame-rate cap below the tier's own rate
+            wait = self.last_sent + self.interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+        tier, hub = self.tier, self.hub
+        with tier.condition:
+            ready = tier.condition.wait_for(
+                lambda: tier.seq > self.last_seq or not hub.running, timeout=timeout
+            )
+            if not ready or not hub.running:
+                return None
+            self.dropped += tier.seq - self.last_seq - 1
+            self.lag_frames = tier.seq - self.last_seq
+            self.last_seq = tier.seq
+            data, captured_at = tier.jpeg, tier.captured_at
+        self.last_sent = time.time()
+        self.sent += 1
+        self.bytes_sent += len(data)
+        self.lag_ms = (self.last_sent - captured_at) * 1000
+        return data
+
+    def stats(self):
+        return {
+            "tier": self.tier.name,
+            "connected_s": round(time.time() - self.connected_at, 1),
+            "sent": self.sent,
+            "bytes_sent": self.bytes_sent,
+            "dropped": self.dropped,
+            "lag_frames": self.lag_frames,
+            "lag_ms": round(self.lag_ms, 1),
+        }
+
+
+class BroadcastHub:
+    """Capture a camera once and share JPEG renditions with every viewer.
+
+    A single thread reads the camera. Each quality tier is encoded once per
+    frame (at most at its own max fps) and only while it has subscribers;
+    every subscriber of a tier receives the same bytes at its own pace.
+    Shared-memory sources are only read while someone is watching, which
+    also tells on-demand producers (pipeline previews) to publish.
+    """
+
+    def __init__(self, name, source, tiers=None):
+        self.name = name
+        self.source = source
+        self.on_demand = isinstance(source, str) and source.startswith(SHM_PREFIX)
+        self.tiers = {
+            tier_name: Tier(tier_name, width, quality, max_fps)
+            for tier_name, width, quality, max_fps in (tiers or parse_tiers())
+        }
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def subscribe(self, tier=DEFAULT_TIER, max_fps=0):
+        """Attach a viewer to `tier`; raises KeyError for unknown tiers."""
+        subscriber = Subscriber(self, self.tiers[tier], max_fps)
+        with self.lock:
+            subscriber.tier.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in subscriber.tier.subscribers:
+                subscriber.tier.subscribers.remove(subscriber)
+
+    def _watched(self):
+        return any(tier.subscribers for tier in self.tiers.values())
+
+    def _run(self):
+        while self.running:
+            if self.on_demand and not self._watched():
+                time.sleep(IDLE_POLL)
+                continue
+            # A frame buffer whose pipeline is not running (yet) is not opened
+            cap = open_capture(self.source)
+            if self.on_demand:
+                cap.latest = True  # Viewers only ever want the newest frame
+            if not cap.isOpened():
+                print(f"[{datetime.now()}] Live {self.name}: cannot connect to camera, retrying...")
+                time.sleep(RECONNECT_DELAY)
+                continue
+            while self.running:
+                if self.on_demand and not self._watched():
+                    time.sleep(IDLE_POLL)
+                    continue
+                success, frame = cap.read()
+                if not success:
+                    print(f"[{datetime.now()}] Live {self.name}: lost connection, reconnecting...")
+                    break
+                # Keep draining the camera, but only encode tiers with an audience
+                captured_at = time.time()
+                for tier in self.tiers.values():
+                    if tier.due(captured_at):
+                        tier.encode(frame, captured_at)
+            cap.release()
+            time.sleep(RECONNECT_DELAY)
+
+    def stats(self):
+        with self.lock:
+            tiers = {name: list(tier.subscribers) for name, tier in self.tiers.items()}
+        return {
+            "subscribers": sum(len(subs) for subs in tiers.values()),
+            "tiers": {
+                name: {
+                    "subscribers": len(subs),
+                    "encoded": self.tiers[name].encoded,
+                    "bytes_encoded": self.tiers[name].bytes_encoded,
+                }
+                for name, subs in tiers.items()
+            },
+            "clients": [s.stats() for subs in tiers.values() for s in subs],
+        }
+
+    def stop(self):
+        self.running = False
+        for tier in self.tiers.values():
+            with tier.condition:
+                tier.condition.notify_all()
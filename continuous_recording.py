@@ -1,24 +1,45 @@
 import signal
+import subprocess
 import threading
 import cv2
+import async_writer
+import recording_catalog
+import retention
+import stage_timing
 import os
 import time
+from async_writer import AsyncVideoWriter
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from frame_buffer import open_capture
+from preview import PreviewPublisher
 
 load_dotenv()
 
 # Ensure videos directory exists
-VIDEO_DIR = "videos/continuous"
+VIDEO_DIR = os.getenv("CONTINUOUS_DIR", "videos/continuous")
 if not os.path.exists(VIDEO_DIR):
     os.makedirs(VIDEO_DIR)
 
 # Video recording settings
 FPS = 20.0
-SEGMENT_DURATION = 3600  # 1 hour (in seconds)
-RETENTION_DAYS = 14  # Delete videos older than 14 days
+SEGMENT_DURATION = int(os.getenv("SEGMENT_DURATION", "3600"))  # 1 hour (in seconds)
 RECONNECT_DELAY = 5  # Seconds to wait before reconnecting
 MAX_RETRIES = 3  # Maximum number of retries for connection
+# "reencode" decodes every frame and writes XVID; "adaptive" does the same but
+# drops to KEEPALIVE_FPS while the scene is static; "passthrough" remuxes the
+# camera's compressed stream into segments with ffmpeg, without decoding
+RECORDING_MODE = os.getenv("RECORDING_MODE", "reencode")
+FFMPEG = os.getenv("FFMPEG", "ffmpeg")
+PASSTHROUGH_FORMAT = os.getenv("PASSTHROUGH_FORMAT", "mkv")  # Container for copied packets
+STALL_TIMEOUT = 30  # Restart ffmpeg if the current segment stops growing this long
+# Adaptive mode: share of pixels that must change between frames to count as
+# scene change, how long full rate is kept afterwards, and the static rate
+ADAPTIVE_THRESHOLD = float(os.getenv("ADAPTIVE_THRESHOLD", "0.005"))
+ADAPTIVE_HOLD = float(os.getenv("ADAPTIVE_HOLD", "5"))
+KEEPALIVE_FPS = float(os.getenv("KEEPALIVE_FPS", "1"))
+SCORE_WIDTH = 160  # Frames are compared at this width
+PIXEL_THRESHOLD = 25  # Grey-level difference for a pixel to count as changed
 video_url = os.getenv("VIDEO_URL")
 print("video url: ", video_url)
 
@@ -30,22 +51,87 @@ def get_video_filename():
     )
 
 
-def cleanup_old_videos():
-    """Delete videos older than `RETENTION_DAYS`."""
-    now = time.time()
-    for filename in os.listdir(VIDEO_DIR):
-        file_path = os.path.join(VIDEO_DIR, filename)
-        if os.path.isfile(file_path) and filename.startswith("continuous_"):
-            file_time = os.path.getmtime(file_path)
-            if now - file_time > RETENTION_DAYS * 86400:  # Convert days to seconds
-                os.remove(file_path)
-                print(f"Deleted old video: {filename}")
+class AdaptiveFrameRate:
+    """Record every frame while the scene changes, `KEEPALIVE_FPS` otherwise.
+
+    Change is scored with a cheap frame difference on a small greyscale copy.
+    The capture time of every written frame goes into a sidecar timecode file
+    (mkvmerge "timecode format v2", milliseconds), so the segment can be
+    played back or remuxed with its real timing.
+    """
+
+    def __init__(self, threshold=ADAPTIVE_THRESHOLD, hold=ADAPTIVE_HOLD, keepalive_fps=KEEPALIVE_FPS):
+        self.threshold = threshold
+        self.hold = hold
+        self.keepalive_interval = 1.0 / keepalive_fps
+        self.previous = None
+        self.last_change = 0.0
+        self.last_written = 0.0
+        self.timestamps = None
+
+    def score(self, frame):
+        """Share of pixels that changed since the previous frame."""
+        (h, w) = frame.shape[:2]
+        small = cv2.resize(frame, (SCORE_WIDTH, max(1, h * SCORE_WIDTH // w)), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        previous, self.previous = self.previous, gray
+        if previous is None or previous.shape != gray.shape:
+            return 1.0
+        diff = cv2.threshold(cv2.absdiff(gray, previous), PIXEL_THRESHOLD, 255, cv2.THRESH_BINARY)[1]
+        return cv2.countNonZero(diff) / diff.size
+
+    def start_segment(self, filename):
+        self.filename = filename
+        self.segment_start = time.time()
+        self.seen = 0
+        self.written = 0
+        self.timestamps = open(os.path.splitext(filename)[0] + ".timestamps.txt", "w")
+        self.timestamps.write("# timecode format v2\n")
+
+    def should_write(self, frame):
+        """Decide whether to record `frame`, logging its timestamp if so."""
+        now = time.time()
+        self.seen += 1
+        if self.score(frame) >= self.threshold:
+            self.last_change = now
+        if now - self.last_change >= self.hold and now - self.last_written < self.keepalive_interval:
+            return False
+        self.last_written = now
+        self.written += 1
+        self.timestamps.write(f"{(now - self.segment_start) * 1000:.0f}\n")
+        return True
+
+    def close_segment(self):
+        """Close the timecode file; returns a callback that reports an upper bound
+        of the bytes saved (benchmark_recording.py measures the real saving).
+
+        The callback runs once the writer has finished the segment file.
+        """
+        if self.timestamps is None:
+            return None
+        self.timestamps.close()
+        self.timestamps = None
+        seen, written = self.seen, self.written
+
+        def report(filename):
+            size = os.path.getsize(filename) if os.path.exists(filename) else 0
+            # Upper bound: the skipped frames are mostly static ones, which
+            # compress far smaller than the average frame written here
+            full_size = size * seen / written if written else 0
+            saved = full_size - size
+            print(
+                f"[{datetime.now()}] Segment {os.path.basename(filename)}: wrote "
+                f"{written}/{seen} frames, {size / 1024 ** 2:.1f} MB, "
+                f"saved at most {saved / 1024 ** 2:.1f} MB "
+                f"({saved / full_size * 100 if full_size else 0:.0f}%)"
+            )
+
+        return report
 
 
 def graceful_exit(sig, frame):
     """Handle script exit to release resources properly."""
     print("\nExiting... Cleaning up resources.")
-    cv2.destroyAllWindows()
     exit(0)
 
 
@@ -53,10 +139,118 @@ def graceful_exit(sig, frame):
 signal.signal(signal.SIGINT, graceful_exit)
 
 
+def passthrough_command(video_url):
+    """ffmpeg command that copies the camera's packets into timed segments."""
+    pattern = os.path.join(
+        VIDEO_DIR, f"continuous_%Y-%m-%d_%H-%M-%S.{PASSTHROUGH_FORMAT}"
+    )
+    command = [FFMPEG, "-hide_banner", "-loglevel", "error", "-nostdin"]
+    if str(video_url).startswith("rtsp://"):
+        command += ["-rtsp_transport", "tcp"]
+    elif os.path.isfile(str(video_url)):
+        command += ["-re"]  # Replay recorded files at their native rate
+    command += [
+        "-i", str(video_url),
+        "-map", "0:v", "-c", "copy",
+        "-f", "segment",
+        "-segment_time", str(SEGMENT_DURATION),
+        "-reset_timestamps", "1",
+        "-strftime", "1",
+        # Each finished segment's filename is printed on stdout
+        "-segment_list", "pipe:1",
+        "-segment_list_type", "flat",
+        pattern,
+    ]
+    return command
+
+
+def _segment_size(process_started):
+    """Size of the newest segment written since ffmpeg started."""
+    newest = None
+    for filename in os.listdir(VIDEO_DIR):
+        if not filename.startswith("continuous_"):
+            continue
+        try:
+            # Retention may delete segments while we look
+            stat = os.stat(os.path.join(VIDEO_DIR, filename))
+        except OSError:
+            continue
+        if stat.st_mtime >= process_started and (newest is None or stat.st_mtime > newest.st_mtime):
+            newest = stat
+    return newest.st_size if newest else 0
+
+
+def _watch_segments(process):
+    """Run the retention cleanup each time ffmpeg closes a segment."""
+    for line in process.stdout:
+        path = os.path.join(VIDEO_DIR, os.path.basename(line.decode().strip()))
+        print(f"[{datetime.now()}] Segment closed: {path}")
+        try:
+            recording_catalog.add_file(path, "continuous")
+        except Exception as e:
+            print(f"Error cataloguing {path}: {e}")
+        threading.Thread(target=retention.enforce, daemon=True).start()
+
+
+def passthrough_recording(video_url):
+    """Record the compressed camera stream in segments without decoding it.
+
+    ffmpeg rotates segments every `SEGMENT_DURATION`; when it exits (camera
+    lost) or stops writing, it is restarted after `RECONNECT_DELAY`.
+    """
+    retry_count = 0
+    while True:
+        started = time.time()
+        try:
+            process = subprocess.Popen(
+                passthrough_command(video_url), stdout=subprocess.PIPE
+            )
+        except FileNotFoundError:
+            print(f"[{datetime.now()}] Error: {FFMPEG} not found; passthrough recording needs ffmpeg.")
+            return
+        print(f"[{datetime.now()}] Recording {video_url} in passthrough mode.")
+        threading.Thread(target=_watch_segments, args=(process,), daemon=True).start()
+
+        last_size, last_growth = 0, time.time()
+        try:
+            while process.poll() is None:
+                time.sleep(RECONNECT_DELAY)
+                size = _segment_size(started)
+                if size != last_size:
+                    last_size, last_growth = size, time.time()
+                    retry_count = 0
+                elif time.time() - last_growth > STALL_TIMEOUT:
+                    print(f"[{datetime.now()}] Error: Stream stalled. Restarting recording...")
+                    process.terminate()
+                    break
+        finally:
+            # ffmpeg finalises the open segment on SIGTERM
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+
+        retry_count += 1
+        print(
+            f"[{datetime.now()}] Error: Lost connection. Reconnection attempt {retry_count} "
+            f"in {RECONNECT_DELAY} seconds..."
+        )
+        time.sleep(RECONNECT_DELAY)
+
+
 def continuous_recording(video_url):
     """Continuously record video in defined segments."""
+    if RECORDING_MODE == "passthrough":
+        if str(video_url).startswith("shm://") or str(video_url).isdigit():
+            print(
+                "Passthrough recording needs the camera URL, not decoded frames; "
+                "falling back to re-encoding."
+            )
+        else:
+            return passthrough_recording(video_url)
+    adaptive = AdaptiveFrameRate() if RECORDING_MODE == "adaptive" else None
+    preview = PreviewPublisher("continuous")
     while True:
-        cap = cv2.VideoCapture(video_url)
+        cap = open_capture(video_url)
         if not cap.isOpened():
             print(
                 f"[{datetime.now()}] Error: Cannot connect to camera. Retrying in {RECONNECT_DELAY} seconds..."
@@ -71,13 +265,18 @@ def continuous_recording(video_url):
         )
         print(f"[{datetime.now()}] Connected to camera. Frame size: {FRAME_SIZE}")
 
-        video_writer = cv2.VideoWriter(
-            get_video_filename(), cv2.VideoWriter_fourcc(*"XVID"), FPS, FRAME_SIZE
+        filename = get_video_filename()
+        # Frames are written on a background thread so disk stalls never block capture
+        video_writer = AsyncVideoWriter(
+            filename, cv2.VideoWriter_fourcc(*"XVID"), FPS, FRAME_SIZE, kind="continuous"
         )
+        if adaptive:
+            adaptive.start_segment(filename)
         start_time = time.time()
 
         while time.time() - start_time < SEGMENT_DURATION:
-            ret, frame = cap.read()
+            with stage_timing.timed("read_wait"):
+                ret, frame = cap.read()
 
             if not ret:
                 print(
@@ -101,21 +300,20 @@ def continuous_recording(video_url):
                     )
                     break  # Exit loop to retry connection
 
-            video_writer.write(frame)
-            cv2.imshow("Continuous Recording", frame)
-
-            if cv2.waitKey(1) & 0xFF == ord("q"):
-                cap.release()
-                video_writer.release()
-                cv2.destroyAllWindows()
-                return  # Exit function
+            with stage_timing.timed("write"):
+                if adaptive is None or adaptive.should_write(frame):
+                    video_writer.write(frame)
+            stage_timing.count("frames")
+            if preview.wanted():
+                preview.publish(frame)
 
         # Release current segment and start a new one
-        video_writer.release()
+        video_writer.release(on_close=adaptive.close_segment() if adaptive else None)
+        print(f"[{datetime.now()}] {async_writer.format_stats()}")
         cap.release()  # Ensure resource cleanup before reconnecting
 
-        # Run cleanup in a separate thread
-        threading.Thread(target=cleanup_old_videos, daemon=True).start()
+        # Run the retention pass in a separate thread
+        threading.Thread(target=retention.enforce, daemon=True).start()
 
 
 if __name__ == "__main__":
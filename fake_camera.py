@@ -0,0 +1,100 @@
+import argparse
+import cv2
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for an MJPEG IP camera, for offline benchmarks:
+#   python fake_camera.py --video clip.mp4  ->  VIDEO_URL=http://localhost:8090/video
+FAKE_CAMERA_PORT = int(os.getenv("FAKE_CAMERA_PORT", "8090"))
+BOUNDARY = "frame"
+
+
+def load_frames(path, max_frames, quality):
+    """Decode a video once and keep its frames as JPEG bytes, plus its fps."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Cannot open video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 20.0
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        ok, buffer = cv2.imencode(".jpg", frame, params)
+        if ok:
+            frames.append(buffer.tobytes())
+    cap.release()
+    if not frames:
+        raise ValueError(f"No frames decoded from {path}")
+    return frames, fps
+
+
+class CameraHandler(BaseHTTPRequestHandler):
+    frames = []
+    fps = 20.0
+    realtime = True
+    loops = 0  # 0 = loop forever
+
+    def do_GET(self):
+        if self.path == "/":
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b"Fake camera is running")
+            return
+        if self.path != "/video":
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.end_headers()
+        interval = 1.0 / self.fps if self.realtime else 0.0
+        next_frame = time.time()
+        played = 0
+        try:
+            while not self.loops or played < self.loops:
+                for jpeg in self.frames:
+                    if interval:
+                        # Pace like a live camera; fall behind rather than burst
+                        next_frame = max(next_frame + interval, time.time())
+                        time.sleep(max(0.0, next_frame - time.time()))
+                    self.wfile.write(
+                        f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                        f"Content-Length: {len(jpeg)}\r\n\r\n".encode()
+                        + jpeg
+                        + b"\r\n"
+                    )
+                played += 1
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a video file as an MJPEG camera")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--port", type=int, default=FAKE_CAMERA_PORT)
+    parser.add_argument("--mode", choices=["realtime", "fast"], default="realtime",
+                        help="pace frames at the file's fps, or send them as fast as clients read")
+    parser.add_argument("--loops", type=int, default=0, help="times to play the file per client (0 = forever)")
+    parser.add_argument("--max-frames", type=int, default=1200, help="frames kept in memory")
+    parser.add_argument("--quality", type=int, default=90)
+    args = parser.parse_args()
+
+    CameraHandler.frames, CameraHandler.fps = load_frames(args.video, args.max_frames, args.quality)
+    CameraHandler.realtime = args.mode == "realtime"
+    CameraHandler.loops = args.loops
+    server = ThreadingHTTPServer(("localhost", args.port), CameraHandler)
+    server.daemon_threads = True
+    print(
+        f"Serving {len(CameraHandler.frames)} frames at {CameraHandler.fps:.1f} fps ({args.mode}) "
+        f"on http://localhost:{args.port}/video"
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import cv2
+import numpy as np
+import os
+import signal
+import stage_timing
+import time
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Frame sources given as "shm://<name>" attach to a ring buffer published by
+# `run_capture` instead of opening the camera again.
+SHM_PREFIX = "shm://"
+BUFFER_NAME = os.getenv("FRAME_BUFFER_NAME", "iot_camera")
+BUFFER_SLOTS = int(os.getenv("FRAME_BUFFER_SLOTS", "32"))
+RECONNECT_DELAY = 5  # Seconds to wait before reconnecting
+ATTACH_TIMEOUT = 30  # Seconds a consumer waits for the capture process
+READ_TIMEOUT = 10  # Seconds without a new frame before read() fails
+
+# Header layout (int64 fields)
+_MAGIC = 0x494F5446
+# _F_DEMAND: last time (ms) a consumer asked for frames, for on-demand producers
+_F_MAGIC, _F_SLOTS, _F_HEIGHT, _F_WIDTH, _F_CHANNELS, _F_WRITE_SEQ, _F_FPS, _F_DEMAND = range(8)
+_HEADER_FIELDS = 8
+
+
+def _layout(slots, height, width, channels):
+    """Return byte offsets of the slot tables and frame data, and the total size."""
+    seq_offset = _HEADER_FIELDS * 8
+    ts_offset = seq_offset + slots * 8
+    data_offset = ts_offset + slots * 8
+    total = data_offset + slots * height * width * channels
+    return seq_offset, ts_offset, data_offset, total
+
+
+class FrameRingBuffer:
+    """Fixed-size ring of decoded frames in shared memory.
+
+    One process writes, any number of processes read. Every slot carries the
+    sequence number of the frame it holds so readers can tell when a slot was
+    overwritten underneath them.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        slots = int(self.header[_F_SLOTS])
+        height = int(self.header[_F_HEIGHT])
+        width = int(self.header[_F_WIDTH])
+        channels = int(self.header[_F_CHANNELS])
+        seq_offset, ts_offset, data_offset, _ = _layout(slots, height, width, channels)
+        self.slots = slots
+        self.shape = (height, width, channels)
+        self.slot_seq = np.ndarray(
+            (slots,), dtype=np.int64, buffer=shm.buf, offset=seq_offset
+        )
+        self.slot_time = np.ndarray(
+            (slots,), dtype=np.float64, buffer=shm.buf, offset=ts_offset
+        )
+        self.frames = np.ndarray(
+            (slots, height, width, channels),
+            dtype=np.uint8,
+            buffer=shm.buf,
+            offset=data_offset,
+        )
+
+    @classmethod
+    def create(cls, name, shape, slots=BUFFER_SLOTS, fps=0.0):
+        """Create a new ring buffer sized for frames of `shape`."""
+        height, width = shape[:2]
+        channels = shape[2] if len(shape) > 2 else 1
+        _, _, _, total = _layout(slots, height, width, channels)
+
+        # A buffer left behind by a crashed capture process would block create()
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_F_SLOTS] = slots
+        header[_F_HEIGHT] = height
+        header[_F_WIDTH] = width
+        header[_F_CHANNELS] = channels
+        header[_F_WRITE_SEQ] = -1
+        header[_F_FPS] = int(fps * 1000)
+        buffer = cls(shm, owner=True)
+        buffer.slot_seq[:] = -1
+        # Written last so readers never see a half-initialised header
+        header[_F_MAGIC] = _MAGIC
+        return buffer
+
+    @classmethod
+    def attach(cls, name, timeout=ATTACH_TIMEOUT):
+        """Attach to an existing ring buffer, waiting for it to be published."""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                shm = None
+            if shm is not None:
+                # Only the creator may unlink the segment; stop the resource
+                # tracker from removing it when this consumer exits.
+                try:
+                    resource_tracker.unregister(shm._name, "shared_memory")
+                except Exception:
+                    pass
+                header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+                if header[_F_MAGIC] == _MAGIC:
+                    del header
+                    return cls(shm, owner=False)
+                del header
+                shm.close()
+            if time.time() >= deadline:
+                raise TimeoutError(f"Frame buffer '{name}' not available")
+            time.sleep(0.1)
+
+    @property
+    def write_seq(self):
+        return int(self.header[_F_WRITE_SEQ])
+
+    @property
+    def fps(self):
+        return self.header[_F_FPS] / 1000.0
+
+    def mark_demand(self):
+        self.header[_F_DEMAND] = int(time.time() * 1000)
+
+    @property
+    def demand_age(self):
+        """Seconds since a consumer last read, or infinity if none ever did."""
+        last = int(self.header[_F_DEMAND])
+        return time.time() - last / 1000.0 if last else float("inf")
+
+    def write(self, frame):
+        """Publish a frame into the next slot."""
+        if frame.shape[:2] != self.shape[:2]:
+            frame = cv2.resize(frame, (self.shape[1], self.shape[0]))
+        seq = self.write_seq + 1
+        slot = seq % self.slots
+        self.slot_seq[slot] = -1  # Mark slot as being written
+        self.frames[slot] = frame.reshape(self.shape)
+        self.slot_time[slot] = time.time()
+        self.slot_seq[slot] = seq
+        self.header[_F_WRITE_SEQ] = seq
+        return seq
+
+    def close(self):
+        # Drop numpy views before closing the mapping
+        self.header = self.slot_seq = self.slot_time = self.frames = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedFrameSource:
+    """Read-only consumer of a `FrameRingBuffer` with its own read cursor.
+
+    Mirrors the parts of `cv2.VideoCapture` the pipelines use (`read`,
+    `isOpened`, `get`, `release`) so it can be swapped in for a camera.
+    Each frame is copied out of its slot, and the slot's sequence number is
+    checked again after the copy, so a frame the writer overwrote mid-copy is
+    dropped rather than returned torn. Callers may keep and draw on frames.
+    """
+
+    def __init__(self, name, timeout=READ_TIMEOUT, latest=False):
+        self.name = name
+        self.timeout = timeout
+        self.latest = latest
+        self.cursor = 0
+        try:
+            self.buffer = FrameRingBuffer.attach(name)
+            self.cursor = self.buffer.write_seq + 1  # Start with the next new frame
+        except TimeoutError as e:
+            # Like an unreachable camera: isOpened() is False and callers retry
+            print(f"[{datetime.now()}] Frame consumer '{name}': {e}")
+            self.buffer = None
+        self.frames_read = 0
+        self.dropped = 0
+        self.last_timestamp = None
+
+    def isOpened(self):
+        return self.buffer is not None
+
+    def get(self, prop):
+        if self.buffer is None:
+            return 0.0
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.buffer.shape[1])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.buffer.shape[0])
+        if prop == cv2.CAP_PROP_FPS:
+            return self.buffer.fps
+        return 0.0
+
+    def read(self):
+        """Return (True, frame) for the next frame, or (False, None) on timeout."""
+        if self.buffer is None:
+            return False, None
+        buffer = self.buffer
+        buffer.mark_demand()
+        deadline = time.time() + self.timeout
+        while True:
+            latest = buffer.write_seq
+            if latest >= self.cursor:
+                break
+            if time.time() >= deadline:
+                return False, None
+            time.sleep(0.001)
+
+        if self.latest:
+            target = latest
+        else:
+            # Never sit on the slot the writer will fill next
+            target = max(self.cursor, latest - buffer.slots + 2)
+        if target > self.cursor:
+            stage_timing.count("buffer_dropped", target - self.cursor)
+        self.dropped += target - self.cursor
+
+        while True:
+            slot = target % buffer.slots
+            if buffer.slot_seq[slot] == target:
+                frame = buffer.frames[slot].copy()
+                timestamp = float(buffer.slot_time[slot])
+                if buffer.slot_seq[slot] == target:
+                    break
+            # Writer lapped us before or during the copy; skip to the newest frame
+            target = buffer.write_seq
+            stage_timing.count("buffer_dropped")
+            self.dropped += 1
+        self.last_timestamp = timestamp
+        self.cursor = target + 1
+        self.frames_read += 1
+        return True, frame
+
+    def release(self):
+        if self.buffer is not None:
+            print(
+                f"[{datetime.now()}] Frame consumer '{self.name}': "
+                f"{self.frames_read} frames read, {self.dropped} dropped"
+            )
+            self.buffer.close()
+            self.buffer = None
+
+
+def parse_sources(spec):
+    """Parse a ","-separated list of "name=url" entries into (name, url) pairs.
+
+    Entries without a name are called camera0, camera1, ...; bare digits are
+    returned as device indexes.
+    """
+    sources = []
+    for i, part in enumerate(p for p in spec.split(",") if p.strip()):
+        name, sep, url = part.partition("=")
+        if not sep:
+            name, url = f"camera{i}", part
+        url = url.strip()
+        sources.append((name.strip(), int(url) if url.isdigit() else url))
+    return sources
+
+
+def open_capture(source):
+    """Open a camera URL, device index or `shm://<name>` frame buffer."""
+    if isinstance(source, str) and source.startswith(SHM_PREFIX):
+        return SharedFrameSource(source[len(SHM_PREFIX):])
+    return cv2.VideoCapture(source)
+
+
+def shared_source_url(name=BUFFER_NAME):
+    return f"{SHM_PREFIX}{name}"
+
+
+def run_capture(video_url, name=BUFFER_NAME, slots=BUFFER_SLOTS):
+    """Decode the camera stream once and publish frames into shared memory."""
+    # main.py stops the capture process with terminate(); unwind so the
+    # shared memory segment is unlinked
+    signal.signal(signal.SIGTERM, lambda sig, frame: exit(0))
+    buffer = None
+    try:
+        while True:
+            cap = cv2.VideoCapture(video_url)
+            if not cap.isOpened():
+                print(
+                    f"[{datetime.now()}] Capture: cannot connect to camera. Retrying in {RECONNECT_DELAY} seconds..."
+                )
+                time.sleep(RECONNECT_DELAY)
+                continue
+
+            while True:
+                with stage_timing.timed("capture_read"):
+                    ret, frame = cap.read()
+                if not ret:
+                    print(f"[{datetime.now()}] Capture: lost connection, reconnecting...")
+                    break
+                if buffer is None:
+                    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+                    buffer = FrameRingBuffer.create(name, frame.shape, slots, fps)
+                    print(
+                        f"[{datetime.now()}] Capture: publishing {frame.shape[1]}x{frame.shape[0]} frames to '{name}' ({slots} slots)"
+                    )
+                buffer.write(frame)
+                stage_timing.count("captured")
+
+            cap.release()
+            time.sleep(RECONNECT_DELAY)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if buffer is not None:
+            buffer.close()
@@ -1,11 +1,25 @@
+import async_writer
 import cv2
 import numpy as np
 import os
 import requests
+import retention
+import signal
+import stage_timing
+import threading
 import time
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-from notify_server import notify_server, notify_server_video
+from async_writer import AsyncVideoWriter
+from alerts import get_aggregator
+from backends import create_backend
+from inference_pool import INFERENCE_WORKERS, InferencePool
+from motion_gate import MotionGate
+from preroll import PrerollBuffer
+from preview import PreviewPublisher
+from scheduler import ADAPTIVE_SCHEDULER, AdaptiveScheduler
+from tracker import PersonTracker
+from threaded_capture import LatestFrameCapture
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,11 +28,11 @@ CHAT_ID = os.getenv("CHAT_ID")
 VIDEO_URL = os.getenv("VIDEO_URL")
 SERVER_URL = os.getenv("SERVER_URL")
 
-VIDEO_DIR = "videos/detection"
+VIDEO_DIR = os.getenv("DETECTION_DIR", "videos/detection")
 if not os.path.exists(VIDEO_DIR):
     os.makedirs(VIDEO_DIR)
 
-IMAGE_DIR = "images/detection"
+IMAGE_DIR = os.getenv("DETECTION_IMAGE_DIR", "images/detection")
 if not os.path.exists(IMAGE_DIR):
     os.makedirs(IMAGE_DIR)
 
@@ -39,150 +53,481 @@ def get_image_filename():
     )
 
 
-def cleanup_old_videos(days=14):
-    """Delete videos older than `days` days."""
-    now = time.time()
-    for filename in os.listdir(VIDEO_DIR):
-        file_path = os.path.join(VIDEO_DIR, filename)
-        if os.path.isfile(file_path) and filename.startswith("motion_"):
-            file_time = os.path.getmtime(file_path)
-            if now - file_time > days * 86400:  # 14 days in seconds
-                os.remove(file_path)
-                print(f"Deleted old video: {filename}")
+CLASSES = [
+    "background",
+    "aeroplane",
+    "bicycle",
+    "bird",
+    "boat",
+    "bottle",
+    "bus",
+    "car",
+    "cat",
+    "chair",
+    "cow",
+    "diningtable",
+    "dog",
+    "horse",
+    "motorbike",
+    "person",
+    "pottedplant",
+    "sheep",
+    "sofa",
+    "train",
+    "tvmonitor",
+]
+PERSON_CONFIDENCE = 0.3
+MIN_RECORD_SECONDS = 10
+
+# Motion-gated cascade: only run the DNN where MOG2 sees motion
+MOTION_GATE = os.getenv("MOTION_GATE", "0") == "1"
+GATE_WIDTH = 320  # Width the motion stage runs at
+GATE_HOLD_FRAMES = 10  # Keep inferring this many frames after motion stops
+ROI_PADDING = 0.25  # Grow the motion region by this fraction on each side
+
+# ROI inference: batch user zones and motion-hot tiles into one forward pass.
+# DETECTION_ZONES is a ";"-separated list of "x1,y1,x2,y2" frame fractions.
+ROI_INFERENCE = os.getenv("ROI_INFERENCE", "0") == "1"
+DETECTION_ZONES = os.getenv("DETECTION_ZONES", "")
+TILE_SIZE = int(os.getenv("ROI_TILE_SIZE", "400"))  # Tile edge in frame pixels
+TILE_OVERLAP = 0.25  # Overlap between neighbouring tiles
+MAX_ROIS = 8  # Upper bound on crops per forward pass
+NMS_THRESHOLD = 0.4
+
+# Run the detector every Nth frame; the tracker carries boxes in between
+DETECTION_STRIDE = max(1, int(os.getenv("DETECTION_STRIDE", "1")))
+
+
+def load_model():
+    """Load and warm up MobileNet-SSD on the backend chosen by INFERENCE_BACKEND."""
+    try:
+        return create_backend()
+    except (FileNotFoundError, ImportError, ValueError) as e:
+        print(e)
+        exit()
 
 
-def run_human_detection():
-    # Load object detection model
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    prototxt = os.path.join(current_dir, "models", "MobileNetSSD_deploy.prototxt.txt")
-    model = os.path.join(current_dir, "models", "MobileNetSSD_deploy.caffemodel")
+def motion_roi(boxes, frame_shape, padding=ROI_PADDING):
+    """Return the padded union of motion boxes as (x1, y1, x2, y2)."""
+    (h, w) = frame_shape[:2]
+    x1 = min(x for x, _, _, _ in boxes)
+    y1 = min(y for _, y, _, _ in boxes)
+    x2 = max(x + bw for x, _, bw, _ in boxes)
+    y2 = max(y + bh for _, y, _, bh in boxes)
+    pad_x = int((x2 - x1) * padding)
+    pad_y = int((y2 - y1) * padding)
+    return (
+        max(0, x1 - pad_x),
+        max(0, y1 - pad_y),
+        min(w, x2 + pad_x),
+        min(h, y2 + pad_y),
+    )
 
-    if not os.path.exists(prototxt) or not os.path.exists(model):
-        print("Model files missing")
-        exit()
 
-    net = cv2.dnn.readNetFromCaffe(prototxt, model)
-
-    CLASSES = [
-        "background",
-        "aeroplane",
-        "bicycle",
-        "bird",
-        "boat",
-        "bottle",
-        "bus",
-        "car",
-        "cat",
-        "chair",
-        "cow",
-        "diningtable",
-        "dog",
-        "horse",
-        "motorbike",
-        "person",
-        "pottedplant",
-        "sheep",
-        "sofa",
-        "train",
-        "tvmonitor",
+def parse_zones(spec=DETECTION_ZONES):
+    """Parse "x1,y1,x2,y2;..." frame fractions into a list of tuples."""
+    zones = []
+    for part in spec.split(";"):
+        if not part.strip():
+            continue
+        try:
+            x1, y1, x2, y2 = (float(v) for v in part.split(","))
+        except ValueError:
+            print(f"Ignoring invalid detection zone: {part}")
+            continue
+        if not (0 <= x1 < x2 <= 1 and 0 <= y1 < y2 <= 1):
+            print(f"Ignoring detection zone outside the frame: {part}")
+            continue
+        zones.append((x1, y1, x2, y2))
+    return zones
+
+
+def zone_rois(zones, frame_shape):
+    """Convert fractional zones to pixel ROIs for this frame size."""
+    (h, w) = frame_shape[:2]
+    return [
+        (int(x1 * w), int(y1 * h), int(x2 * w), int(y2 * h)) for x1, y1, x2, y2 in zones
     ]
 
-    # Check for valid video URL
-    if not VIDEO_URL:
-        print("Error: VIDEO_URL not found in environment variables")
-        exit()
 
-    cap = cv2.VideoCapture(VIDEO_URL)
-    if not cap.isOpened():
-        print("Error: Cannot connect to camera")
-        exit()
+def hot_tiles(boxes, frame_shape, tile=TILE_SIZE, overlap=TILE_OVERLAP, limit=MAX_ROIS):
+    """Return the overlapping grid tiles that contain motion, busiest first."""
+    (h, w) = frame_shape[:2]
+    tile_w, tile_h = min(tile, w), min(tile, h)
+    step_x = max(1, int(tile_w * (1 - overlap)))
+    step_y = max(1, int(tile_h * (1 - overlap)))
+    xs = list(range(0, max(w - tile_w, 0) + 1, step_x))
+    ys = list(range(0, max(h - tile_h, 0) + 1, step_y))
+    # Make sure the right and bottom edges are covered
+    if xs[-1] + tile_w < w:
+        xs.append(w - tile_w)
+    if ys[-1] + tile_h < h:
+        ys.append(h - tile_h)
+
+    scored = []
+    for ty in ys:
+        for tx in xs:
+            area = 0
+            for x, y, bw, bh in boxes:
+                ix = min(tx + tile_w, x + bw) - max(tx, x)
+                iy = min(ty + tile_h, y + bh) - max(ty, y)
+                if ix > 0 and iy > 0:
+                    area += ix * iy
+            if area:
+                scored.append((area, (tx, ty, tx + tile_w, ty + tile_h)))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [roi for _, roi in scored[:limit]]
+
+
+def people_by_image(detections, rois):
+    """Split a batched SSD output into person detections per input image.
+
+    `rois[i]` is the (x1, y1, x2, y2) region image `i` was cropped from; boxes
+    are returned in the coordinates of the frame the region belongs to.
+    """
+    results = [[] for _ in rois]
+    for i in np.arange(0, detections.shape[2]):
+        confidence = detections[0, 0, i, 2]
+        idx = int(detections[0, 0, i, 1])
+        image_id = int(detections[0, 0, i, 0])
+        if (
+            confidence > PERSON_CONFIDENCE
+            and idx < len(CLASSES)
+            and CLASSES[idx] == "person"
+            and 0 <= image_id < len(rois)
+        ):
+            (x_off, y_off, x2, y2) = rois[image_id]
+            (w, h) = (x2 - x_off, y2 - y_off)
+            box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
+            (startX, startY, endX, endY) = box.astype("int")
+            results[image_id].append(
+                (float(confidence), (startX + x_off, startY + y_off, endX + x_off, endY + y_off))
+            )
+    return results
+
+
+def detect_people_rois(net, frame, rois, size=300):
+    """Run MobileNet-SSD on several ROIs of a frame in one forward pass.
+
+    Returns a list of (confidence, (startX, startY, endX, endY)) in frame
+    coordinates. Overlapping detections from different ROIs are merged with
+    NMS.
+    """
+    with stage_timing.timed("preprocess"):
+        crops = [frame[y1:y2, x1:x2] for (x1, y1, x2, y2) in rois]
+        blob = cv2.dnn.blobFromImages(crops, 0.007843, (size, size), 127.5)
+    with stage_timing.timed("inference"):
+        net.setInput(blob)
+        detections = net.forward()
 
-    # Recording setup
-    min_record_seconds = 10
-    video_writer = None
-    recording = False
-    record_end_time = None  # Timestamp when recording should end
+    with stage_timing.timed("postprocess"):
+        people = [p for image_people in people_by_image(detections, rois) for p in image_people]
 
-    print("Motion detection started...")
+        if len(rois) > 1 and len(people) > 1:
+            people = suppress_overlaps(people)
+    return people
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Failed to grab frame")
-            break
 
+def suppress_overlaps(people, threshold=NMS_THRESHOLD):
+    """Non-maximum suppression over (confidence, box) detections."""
+    boxes = [[int(x1), int(y1), int(x2 - x1), int(y2 - y1)] for _, (x1, y1, x2, y2) in people]
+    scores = [confidence for confidence, _ in people]
+    keep = cv2.dnn.NMSBoxes(boxes, scores, PERSON_CONFIDENCE, threshold)
+    return [people[i] for i in np.array(keep).flatten()]
+
+
+def detect_people(net, frame, roi=None, size=300):
+    """Run MobileNet-SSD on the frame (or an ROI of it).
+
+    Returns a list of (confidence, (startX, startY, endX, endY)) in frame
+    coordinates.
+    """
+    if roi is None:
         (h, w) = frame.shape[:2]
-        blob = cv2.dnn.blobFromImage(
-            cv2.resize(frame, (300, 300)), 0.007843, (300, 300), 127.5
+        roi = (0, 0, w, h)
+    return detect_people_rois(net, frame, [roi], size)
+
+
+def draw_people(frame, people, labels=None):
+    """Draw person boxes on `frame`."""
+    for i, (confidence, (startX, startY, endX, endY)) in enumerate(people):
+        cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 255, 0), 2)
+        label = labels[i] if labels else f"Person: {confidence * 100:.1f}%"
+        cv2.putText(
+            frame,
+            label,
+            (startX, startY - 10),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5,
+            (0, 255, 0),
+            2,
         )
-        net.setInput(blob)
-        detections = net.forward()
+    return frame
 
-        person_detected = False
-
-        for i in np.arange(0, detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            idx = int(detections[0, 0, i, 1])
-            if confidence > 0.3 and idx < len(CLASSES) and CLASSES[idx] == "person":
-                person_detected = True
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (startX, startY, endX, endY) = box.astype("int")
-                cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 255, 0), 2)
-                label = f"Person: {confidence * 100:.1f}%"
-                cv2.putText(
-                    frame,
-                    label,
-                    (startX, startY - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.5,
-                    (0, 255, 0),
-                    2,
-                )
 
+class DetectionRecorder:
+    """Start, extend and stop detection clips from the tracker's state.
+
+    Every new track is an alert event, coalesced and rate-limited by the
+    alert aggregator; the clip runs while any track is alive and for
+    `min_record_seconds` after the last one.
+    """
+
+    def __init__(self, min_record_seconds=MIN_RECORD_SECONDS):
+        self.min_record_seconds = min_record_seconds
+        self.preroll = PrerollBuffer()
+        self.video_writer = None
+        self.recording = False
+        self.record_end_time = None  # Timestamp when recording should end
+        self.video_filename = None
+        self.alerts = get_aggregator()
+
+    def handle(self, frame, tracks, new_tracks=(), captured_at=None):
+        """Update the recording state for one annotated frame captured at `captured_at`."""
+        (h, w) = frame.shape[:2]
         current_time = time.time()
 
-        if person_detected:
-            if not recording:
-                image_filename = get_image_filename()
-                cv2.imwrite(image_filename, frame)
-                print(f"File saved at: {image_filename}")
-                notify_server(image_filename)
-                # os.remove(image_filename)
-                print("Person detected — image sent.")
+        if new_tracks:
+            # Saved and uploaded only if the aggregator sends this snapshot
+            self.alerts.add(frame, get_image_filename(), [track.box for track in new_tracks])
+            ids = ", ".join(f"#{track.id}" for track in new_tracks)
+            print(f"Person detected ({ids}) — alert queued.")
 
+        if tracks:
+            if not self.recording:
                 # Start recording
-                recording = True
-                record_end_time = current_time + min_record_seconds
-                video_filename = get_video_filename()
-                video_writer = cv2.VideoWriter(
-                    video_filename, cv2.VideoWriter_fourcc(*"XVID"), 20.0, (w, h)
+                self.recording = True
+                self.record_end_time = current_time + self.min_record_seconds
+                self.video_filename = get_video_filename()
+                self.video_writer = AsyncVideoWriter(
+                    self.video_filename,
+                    cv2.VideoWriter_fourcc(*"XVID"),
+                    20.0,
+                    (w, h),
+                    kind="detection",
                 )
-                print(f"Recording started: {video_filename}")
+                print(f"Recording started: {self.video_filename}")
+
+                # Start the clip with the seconds leading up to the detection.
+                # Frames are decoded one at a time as they are written, and
+                # wait for queue room so the burst cannot drop the live frames
+                written = 0
+                for timestamp, old_frame in self.preroll.drain(with_timestamps=True):
+                    if old_frame.shape[:2] != (h, w):
+                        old_frame = cv2.resize(old_frame, (w, h))
+                    self.video_writer.write(old_frame, timestamp, block=True)
+                    written += 1
+                if written:
+                    print(f"Wrote {written} pre-roll frames")
             else:
                 # Extend recording time
-                record_end_time = current_time + min_record_seconds
+                self.record_end_time = current_time + self.min_record_seconds
                 print("Person detected again — extended recording.")
 
-        if recording:
-            video_writer.write(frame)
-            if current_time >= record_end_time:
-                video_writer.release()
-                print(f"Recording stopped. Sending video: {video_filename}")
-                notify_server_video(video_filename)
-                recording = False
+        if self.recording:
+            self.video_writer.write(frame, captured_at)
+            if current_time >= self.record_end_time:
+                # The clip is queued for upload only once the writer has finished it
+                self.video_writer.release(on_close=self.alerts.send_video)
+                self.video_writer = None
+                print(f"Recording stopped. Sending video: {self.video_filename}")
+                self.recording = False
+        else:
+            self.preroll.push(frame, captured_at)
+
+    def close(self):
+        if self.video_writer:
+            self.video_writer.release(wait=True)
+            self.video_writer = None
+
+
+def run_human_detection(
+    video_url=None, motion_gate=None, roi_inference=None, workers=None, adaptive=None
+):
+    video_url = video_url or VIDEO_URL
+    if motion_gate is None:
+        motion_gate = MOTION_GATE
+    if roi_inference is None:
+        roi_inference = ROI_INFERENCE
+    if workers is None:
+        workers = INFERENCE_WORKERS
+    if adaptive is None:
+        adaptive = ADAPTIVE_SCHEDULER
+
+    # Load object detection model (pool workers load their own copies)
+    if workers > 0:
+        net = None
+        try:
+            pool = InferencePool(workers)
+        except (FileNotFoundError, ImportError, ValueError) as e:
+            print(e)
+            exit()
+        print(f"Inference pool started with {workers} workers")
+    else:
+        net = load_model()
+        pool = None
+
+    # Check for valid video URL
+    if not video_url:
+        print("Error: VIDEO_URL not found in environment variables")
+        exit()
+
+    # Frames are read on a background thread; the loop only sees the newest one
+    cap = LatestFrameCapture(video_url)
+    if not cap.isOpened():
+        print("Error: Cannot connect to camera")
+        exit()
+
+    # Recording setup
+    recorder = DetectionRecorder()
+
+    # Tracking setup
+    tracker = PersonTracker()
+    stride = DETECTION_STRIDE
+    frames_since_detector = stride  # First frame always runs the detector
+    frames_carried = 0
+
+    # Stride and input size follow the latency/CPU budget in adaptive mode
+    scheduler = AdaptiveScheduler() if adaptive else None
+    input_size = 300
+
+    # Cascade setup
+    # ROI mode needs the motion stage to find hot tiles
+    gate = MotionGate(width=GATE_WIDTH) if motion_gate or roi_inference else None
+    gate_hold = 0
+    last_motion_boxes = []
+    zones = parse_zones() if roi_inference else []
+    frames_inferred = 0
+    frames_skipped = 0
+
+    # Annotated frames are published for live_server.py only while watched
+    preview = PreviewPublisher("detection")
+
+    # Ctrl+C / terminate() finish the loop so clips are closed and sent
+    stop = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
 
-        cv2.imshow("Human Detection Video", frame)
+    print("Motion detection started...")
 
-        if cv2.waitKey(1) & 0xFF == ord("q"):
+    while not stop.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            print("Failed to grab frame")
             break
 
+        (h, w) = frame.shape[:2]
+
+        motion_boxes = None
+        if gate is not None:
+            with stage_timing.timed("motion"):
+                _, boxes, _ = gate.apply(frame)
+            if boxes:
+                last_motion_boxes = boxes
+                gate_hold = GATE_HOLD_FRAMES
+            elif gate_hold > 0:
+                gate_hold -= 1
+            else:
+                last_motion_boxes = []
+            motion_boxes = last_motion_boxes
+
+        if scheduler is not None:
+            if (gate is not None and boxes) or recorder.recording:
+                scheduler.boost()
+            stride = scheduler.stride
+            input_size = scheduler.input_size
+
+        # Only every `stride`-th frame is a detector run
+        frames_since_detector += 1
+        run_detector = frames_since_detector >= stride
+        if run_detector:
+            frames_since_detector = 0
+
+        if not run_detector:
+            rois = []
+            frames_carried += 1
+        elif roi_inference:
+            rois = zone_rois(zones, frame.shape) + hot_tiles(motion_boxes, frame.shape)
+        elif motion_boxes is None:
+            rois = [(0, 0, w, h)]
+        elif motion_boxes:
+            rois = [motion_roi(motion_boxes, frame.shape)]
+        else:
+            rois = []
+        rois = rois[:MAX_ROIS]
+
+        if rois:
+            frames_inferred += 1
+        elif run_detector:
+            frames_skipped += 1
+
+        inference_time = None
+        if pool is None:
+            start = time.time()
+            people = detect_people_rois(net, frame, rois, input_size) if rois else []
+            if rois:
+                inference_time = time.time() - start
+            decided = [(frame, people, (cap.read_time, run_detector))]
+        else:
+            pool.submit(frame, rois, (cap.read_time, run_detector), input_size)
+            decided = pool.completed()
+
+        # Results come back in capture order, so start/extend decisions hold
+        for frame, people, (captured_at, detector_ran) in decided:
+            new_tracks = ()
+            if detector_ran:
+                # A gated frame counts as a run that saw nobody
+                new_tracks, ended = tracker.update(people)
+                for track in ended:
+                    print(f"Track #{track.id} ended after {track.dwell:.1f} s")
+            tracks = tracker.tracks
+            frame = draw_people(
+                frame,
+                tracker.people(),
+                [f"Person #{t.id}: {t.dwell:.0f}s" for t in tracks],
+            )
+            start = time.time()
+            recorder.handle(frame, tracks, new_tracks, captured_at)
+            write_time = time.time() - start
+            stage_timing.record("record", write_time)
+            latency = cap.mark_decision(captured_at)
+            if scheduler is not None:
+                scheduler.record(cap.read_wait, inference_time, write_time, latency)
+            if preview.wanted():
+                preview.publish(frame)
+
+        report = cap.report_due()
+        if report:
+            print(report)
+            total = frames_inferred + frames_skipped + frames_carried
+            print(
+                f"[{datetime.now()}] Detector: {frames_inferred}/{total} frames inferred, "
+                f"{frames_skipped} skipped by motion gate, {frames_carried} carried by tracker, "
+                f"{len(tracker.tracks)} active tracks"
+            )
+            if scheduler is not None:
+                print(f"[{datetime.now()}] Scheduler: {scheduler.metrics()}")
+            preroll = recorder.preroll.stats()
+            print(
+                f"[{datetime.now()}] Pre-roll: {preroll['frames']} frames / {preroll['seconds']:.1f} s, "
+                f"{preroll['bytes'] / 1048576:.1f}/{preroll['max_bytes'] / 1048576:.0f} MB, "
+                f"encode avg {preroll['avg_encode_ms']:.1f} ms"
+            )
+            print(f"[{datetime.now()}] {async_writer.format_stats()}")
+
+    if pool is not None:
+        for frame, people, (captured_at, detector_ran) in pool.drain():
+            new_tracks = tracker.update(people)[0] if detector_ran else ()
+            recorder.handle(draw_people(frame, tracker.people()), tracker.tracks, new_tracks, captured_at)
+        pool.close()
+
     cap.release()
-    if video_writer:
-        video_writer.release()
-    cv2.destroyAllWindows()
+    recorder.close()
+    preview.close()
 
-    # Cleanup old videos
-    cleanup_old_videos()
+    # Apply age and space limits to the recordings
+    retention.enforce()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+import cv2
+import metrics
+import multiprocessing
+import os
+from collections import deque
+from dotenv import load_dotenv
+from backends import create_backend
+
+load_dotenv()
+
+# INFERENCE_WORKERS > 0 hands detection to a pool of worker processes
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+WORKER_CV_THREADS = int(os.getenv("WORKER_CV_THREADS", "1"))  # OpenCV threads per worker
+
+_net = None
+
+
+def _init_worker(cv_threads):
+    """Load a private copy of the net in each worker process."""
+    global _net
+    cv2.setNumThreads(cv_threads)
+    _net = create_backend()
+
+
+def _detect(frame, rois, size):
+    from human_detection import detect_people_rois
+
+    return detect_people_rois(_net, frame, rois, size)
+
+
+class InferencePool:
+    """Run person detection on a process pool and return results in frame order.
+
+    `submit()` queues a frame with its ROIs and a caller context; `completed()`
+    returns (frame, people, context) for every frame whose result is ready,
+    strictly in submission order, so recording decisions see frames in the
+    same order they were captured. At most `max_in_flight` frames are
+    outstanding; beyond that `completed()` blocks on the oldest one.
+    """
+
+    def __init__(self, workers=INFERENCE_WORKERS, cv_threads=WORKER_CV_THREADS, max_in_flight=None):
+        # A worker whose initializer fails is respawned forever, so load the
+        # model here once; FileNotFoundError/ValueError reach the caller
+        create_backend(warmup=False)
+        self.workers = workers
+        self.max_in_flight = max_in_flight or workers * 2
+        self.pool = multiprocessing.Pool(
+            processes=workers, initializer=_init_worker, initargs=(cv_threads,)
+        )
+        self.pending = deque()
+        metrics.gauge("inference_in_flight", "Frames submitted to the inference pool", lambda: len(self.pending))
+
+    def submit(self, frame, rois, context=None, size=300):
+        if rois:
+            result = self.pool.apply_async(_detect, (frame, rois, size))
+        else:
+            result = None  # Nothing to infer; keep the slot so order is preserved
+        self.pending.append((result, frame, context))
+
+    def _pop(self):
+        result, frame, context = self.pending.popleft()
+        people = result.get() if result is not None else []
+        return frame, people, context
+
+    def completed(self):
+        done = []
+        while self.pending:
+            result = self.pending[0][0]
+            if result is not None and not result.ready():
+                if len(self.pending) < self.max_in_flight:
+                    break
+                result.wait()
+            done.append(self._pop())
+        return done
+
+    def drain(self):
+        """Wait for every outstanding frame and return them in order."""
+        done = []
+        while self.pending:
+            done.append(self._pop())
+        return done
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
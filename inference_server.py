@@ -0,0 +1,211 @@
+import cv2
+import os
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from frame_buffer import parse_sources
+from human_detection import load_model, people_by_image
+from threaded_capture import LatestFrameCapture
+
+load_dotenv()
+
+# CAMERA_URLS is a ","-separated list of "name=url" entries, e.g.
+# "front=rtsp://10.0.0.5/stream,garage=shm://garage". Falls back to VIDEO_URL.
+CAMERA_URLS = os.getenv("CAMERA_URLS", "")
+VIDEO_URL = os.getenv("VIDEO_URL")
+MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "8"))
+MAX_BATCH_LATENCY = float(os.getenv("INFERENCE_MAX_BATCH_LATENCY", "0.05"))  # Seconds
+RECONNECT_DELAY = 5  # Seconds to wait before reconnecting a camera
+REPORT_INTERVAL = 30  # Seconds between stats reports
+
+
+def parse_cameras(spec=CAMERA_URLS):
+    """Parse CAMERA_URLS into a list of (name, url) pairs."""
+    cameras = parse_sources(spec)
+    if not cameras and VIDEO_URL:
+        cameras.append(("camera0", VIDEO_URL))
+    return cameras
+
+
+class CameraFeed:
+    """Per-camera state: newest-frame reader, result routing and counters."""
+
+    def __init__(self, name, source, callback=None):
+        self.name = name
+        self.source = source
+        self.callback = callback
+        self.cap = LatestFrameCapture(source)
+        self.reconnect_at = None
+        self.opener = None  # Thread reopening the camera, if any
+        self.last_people = []
+        self.frames = 0
+        self.person_frames = 0
+
+    def deliver(self, frame, people):
+        self.frames += 1
+        if people:
+            self.person_frames += 1
+        if self.callback is not None:
+            self.callback(self.name, frame, people)
+        elif people and not self.last_people:
+            print(f"[{datetime.now()}] {self.name}: person detected ({len(people)})")
+        self.last_people = people
+
+
+class InferenceServer:
+    """One MobileNet-SSD net serving many cameras with batched forward passes.
+
+    Every tick collects the newest frame from each camera that has one, waits
+    at most `max_batch_latency` seconds for stragglers, and runs a single
+    `net.forward()` over up to `max_batch` frames. Results are handed back to
+    each camera's callback as a list of (confidence, box) person detections.
+    """
+
+    def __init__(self, max_batch=MAX_BATCH, max_batch_latency=MAX_BATCH_LATENCY, net=None):
+        self.max_batch = max_batch
+        self.max_batch_latency = max_batch_latency
+        self.net = net if net is not None else load_model()
+        self.feeds = []
+        self.next_feed = 0  # Round-robin start when cameras exceed max_batch
+        self.running = False
+
+        # Stats
+        self.batches = 0
+        self.batch_frames = 0
+        self.forward_total = 0.0
+        self.forward_max = 0.0
+        self.last_report = time.time()
+
+    @classmethod
+    def from_env(cls):
+        server = cls()
+        for name, url in parse_cameras():
+            server.add_camera(name, url)
+        return server
+
+    def add_camera(self, name, source, callback=None):
+        feed = CameraFeed(name, source, callback)
+        if not feed.cap.isOpened():
+            print(f"[{datetime.now()}] {name}: cannot connect to camera, retrying later")
+            feed.reconnect_at = time.time() + RECONNECT_DELAY
+        self.feeds.append(feed)
+        return feed
+
+    def _reconnect(self, feed):
+        now = time.time()
+        if feed.reconnect_at is None:
+            print(f"[{datetime.now()}] {feed.name}: lost connection, reconnecting...")
+            feed.cap.release()
+            feed.reconnect_at = now + RECONNECT_DELAY
+        elif now >= feed.reconnect_at and not (feed.opener and feed.opener.is_alive()):
+            # Opening a dead camera can block for its whole connect timeout,
+            # so reopen off the batching loop and swap the capture in once open
+            feed.cap.release()
+            feed.opener = threading.Thread(target=self._reopen, args=(feed,), daemon=True)
+            feed.opener.start()
+
+    def _reopen(self, feed):
+        cap = LatestFrameCapture(feed.source)
+        if cap.isOpened():
+            feed.cap = cap
+            feed.reconnect_at = None
+            print(f"[{datetime.now()}] {feed.name}: reconnected")
+        else:
+            cap.release()
+            feed.reconnect_at = time.time() + RECONNECT_DELAY
+
+    def collect_batch(self):
+        """Gather up to `max_batch` new frames, waiting at most the batch latency."""
+        batch = []
+        pending = self.feeds[self.next_feed:] + self.feeds[:self.next_feed]
+        deadline = time.time() + self.max_batch_latency
+        while pending and len(batch) < self.max_batch:
+            remaining = []
+            for feed in pending:
+                if len(batch) >= self.max_batch:
+                    remaining.append(feed)
+                    continue
+                if feed.reconnect_at is not None or feed.cap.failed:
+                    self._reconnect(feed)
+                    continue
+                ret, frame = feed.cap.read(timeout=0)
+                if ret:
+                    batch.append((feed, frame))
+                else:
+                    remaining.append(feed)
+            pending = remaining
+            if not pending or len(batch) >= self.max_batch or time.time() >= deadline:
+                break
+            time.sleep(0.002)
+        if self.feeds:
+            self.next_feed = (self.next_feed + len(batch)) % len(self.feeds)
+        return batch
+
+    def infer(self, batch):
+        """Run one forward pass over the batch and route results per camera."""
+        frames = [frame for _, frame in batch]
+        rois = [(0, 0, frame.shape[1], frame.shape[0]) for frame in frames]
+        start = time.time()
+        blob = cv2.dnn.blobFromImages(frames, 0.007843, (300, 300), 127.5)
+        self.net.setInput(blob)
+        detections = self.net.forward()
+        elapsed = time.time() - start
+
+        self.batches += 1
+        self.batch_frames += len(batch)
+        self.forward_total += elapsed
+        self.forward_max = max(self.forward_max, elapsed)
+
+        for (feed, frame), people in zip(batch, people_by_image(detections, rois)):
+            feed.deliver(frame, people)
+            feed.cap.mark_decision()
+
+    def report(self):
+        now = time.time()
+        window = now - self.last_report
+        if window < REPORT_INTERVAL:
+            return
+        avg_batch = self.batch_frames / self.batches if self.batches else 0.0
+        avg_forward = self.forward_total / self.batches * 1000 if self.batches else 0.0
+        print(
+            f"[{datetime.now()}] Inference: {self.batches} batches, avg size {avg_batch:.1f}, "
+            f"forward avg {avg_forward:.1f} ms, max {self.forward_max * 1000:.1f} ms"
+        )
+        for feed in self.feeds:
+            stats = feed.cap.stats()
+            print(
+                f"    {feed.name}: {feed.frames / window:.1f} fps, "
+                f"{stats['skipped']} skipped, latency avg {stats['avg_latency_ms']:.1f} ms"
+            )
+            feed.frames = 0
+        self.batches = self.batch_frames = 0
+        self.forward_total = self.forward_max = 0.0
+        self.last_report = now
+
+    def run(self):
+        if not self.feeds:
+            print("Error: no cameras configured (set CAMERA_URLS or VIDEO_URL)")
+            return
+        print(f"Inference server started for {len(self.feeds)} camera(s)...")
+        self.running = True
+        try:
+            while self.running:
+                batch = self.collect_batch()
+                if batch:
+                    self.infer(batch)
+                else:
+                    time.sleep(0.005)
+                self.report()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for feed in self.feeds:
+                feed.cap.release()
+
+    def stop(self):
+        self.running = False
+
+
+if __name__ == "__main__":
+    InferenceServer.from_env().run()
@@ -1,30 +1,141 @@
-from flask import Flask, Response
-import cv2
+from flask import Flask, Response, abort, jsonify, request
+import os
+import time
+import recording_catalog
+import supervisor
+from dotenv import load_dotenv
+from broadcast import DEFAULT_TIER, BroadcastHub
+from frame_buffer import BUFFER_NAME, parse_sources
+from preview import PREVIEW_VIEWS, preview_url
+
+load_dotenv()
 
 app = Flask(__name__)
 
-camera = cv2.VideoCapture(
-    0
-)  # Use external camera: cv2.VideoCapture("rtsp://camera-ip")
+# LIVE_SOURCE may be a device index, a camera URL, or "shm://<name>" to share
+# the frames already decoded by main.py's capture process. LIVE_SOURCES adds
+# more cameras as "name=url,..." served at /live/<name>.
+LIVE_SOURCE = os.getenv("LIVE_SOURCE", "0")
+LIVE_SOURCES = os.getenv("LIVE_SOURCES", "")
+DEFAULT_CAMERA = "default"
+
+sources = [
+    (DEFAULT_CAMERA, int(LIVE_SOURCE) if LIVE_SOURCE.isdigit() else LIVE_SOURCE)
+]  # Use external camera: LIVE_SOURCE="rtsp://camera-ip"
+sources += parse_sources(LIVE_SOURCES)
+
+# One capture/encode thread per camera, shared by every viewer
+hubs = {name: BroadcastHub(name, source) for name, source in sources}
+
+
+def preview_buffers():
+    """Frame buffer name of every camera the supervisor runs, by camera name."""
+    try:
+        cameras = supervisor.load_cameras()
+    except (OSError, ValueError) as e:
+        print(f"Invalid camera configuration, previews of the default camera only: {e}")
+        cameras = []
+    buffers = {DEFAULT_CAMERA: BUFFER_NAME}
+    for camera in cameras:
+        buffers[camera.name] = camera.environment().get("FRAME_BUFFER_NAME", BUFFER_NAME)
+    return buffers
+
+
+# Pipeline previews, served at /preview/<camera>/<view>; their hubs only read while watched
+preview_hubs = {
+    (camera, view): BroadcastHub(f"{camera}/{view}", preview_url(view, buffer_name))
+    for camera, buffer_name in preview_buffers().items()
+    for view in PREVIEW_VIEWS
+}
 
 
-def generate_frames():
-    while True:
-        success, frame = camera.read()
-        if not success:
-            break
-        else:
-            _, buffer = cv2.imencode(".jpg", frame)
-            frame = buffer.tobytes()
+def generate_frames(hub, subscriber):
+    try:
+        while True:
+            frame = subscriber.next_frame()
+            if frame is None:
+                break
             yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
+    finally:
+        # Runs when the client disconnects and the generator is closed
+        hub.unsubscribe(subscriber)
 
 
-@app.route("/live")
-def video_feed():
+def stream(hub):
+    # ?tier=high|medium|low picks resolution/quality; ?fps= caps this client
+    tier = request.args.get("tier", DEFAULT_TIER)
+    if tier not in hub.tiers:
+        abort(400, f"Unknown tier '{tier}' (choose from {', '.join(hub.tiers)})")
+    max_fps = request.args.get("fps", 0, type=float)
+    subscriber = hub.subscribe(tier, max_fps)
     return Response(
-        generate_frames(), mimetype="multipart/x-mixed-replace; boundary=frame"
+        generate_frames(hub, subscriber),
+        mimetype="multipart/x-mixed-replace; boundary=frame",
     )
 
 
+@app.route("/live")
+@app.route("/live/<camera>")
+def video_feed(camera=DEFAULT_CAMERA):
+    if camera not in hubs:
+        abort(404)
+    return stream(hubs[camera])
+
+
+@app.route("/preview/<view>")
+@app.route("/preview/<camera>/<view>")
+def preview_feed(view, camera=DEFAULT_CAMERA):
+    # Annotated frames / masks published by the running pipelines
+    if (camera, view) not in preview_hubs:
+        abort(404)
+    return stream(preview_hubs[(camera, view)])
+
+
+def _time_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return recording_catalog.parse_time(value)
+    except ValueError:
+        abort(400, f"Invalid time for '{name}': {value}")
+
+
+@app.route("/recordings")
+def recordings():
+    # ?start=&end= (ISO or epoch, default the last 24 h), optional &camera= &kind=
+    end = _time_arg("end", time.time())
+    start = _time_arg("start", end - 86400)
+    return jsonify(
+        recording_catalog.between(
+            start, end, request.args.get("camera"), request.args.get("kind")
+        )
+    )
+
+
+@app.route("/recordings/at")
+def recording_at():
+    # ?time= -> file plus offset/keyframe to seek to, or 404
+    at = _time_arg("time")
+    if at is None:
+        abort(400, "Missing time parameter")
+    recording = recording_catalog.lookup(
+        at, request.args.get("camera"), request.args.get("kind")
+    )
+    if recording is None:
+        abort(404)
+    return jsonify(recording)
+
+
+@app.route("/live-stats")
+def live_stats():
+    return jsonify({name: hub.stats() for name, hub in hubs.items()})
+
+
+@app.route("/preview-stats")
+def preview_stats():
+    return jsonify({f"{camera}/{view}": hub.stats() for (camera, view), hub in preview_hubs.items()})
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000, debug=True)
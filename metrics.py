@@ -0,0 +1,141 @@
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Each process started from main.py serves /metrics on METRICS_PORT plus its
+# offset below; METRICS_PORT=0 disables the endpoints
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+PROCESS_PORTS = {"capture": 0, "continuous": 1, "human": 2, "retention": 3, "motion": 4, "supervisor": 5}
+# Set per camera by supervisor.py; added as a camera="..." label
+CAMERA_NAME = os.getenv("CAMERA_NAME")
+# Histogram buckets in seconds, from a fast resize up to a slow upload
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_lock = threading.Lock()
+_process = "main"
+_counters = {}  # name -> [help, value]
+_histograms = {}  # (name, stage) -> [bucket counts..., sum, count]
+_histogram_help = {}
+_gauges = {}  # (name, labels) -> (help, callback)
+
+
+def _key(name):
+    return f"iot_{name}"
+
+
+def inc(name, n=1, help=""):
+    """Increment counter `iot_<name>_total`."""
+    with _lock:
+        counter = _counters.get(name)
+        if counter is None:
+            counter = _counters[name] = [help or name.replace("_", " "), 0]
+        counter[1] += n
+
+
+def observe(name, stage, seconds, help=""):
+    """Add a sample to histogram `iot_<name>_seconds{stage=...}`."""
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get((name, stage))
+        if histogram is None:
+            histogram = _histograms[(name, stage)] = [0] * (len(BUCKETS) + 3)
+            _histogram_help.setdefault(name, help or name.replace("_", " "))
+        histogram[index] += 1  # Cumulated when rendered; index len(BUCKETS) is +Inf
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+
+def gauge(name, help, callback, labels=None):
+    """Expose `iot_<name>{labels}` as the value of `callback()` at scrape time."""
+    key = (name, tuple(sorted((labels or {}).items())))
+    with _lock:
+        _gauges[key] = (help, callback)
+
+
+def render():
+    """All metrics of this process in the Prometheus text format."""
+    label = f'process="{_process}"'
+    if CAMERA_NAME:
+        label += f',camera="{CAMERA_NAME}"'
+    with _lock:
+        counters = {name: list(value) for name, value in _counters.items()}
+        histograms = {key: list(value) for key, value in _histograms.items()}
+        gauges = dict(_gauges)
+    lines = []
+    for name, (help, value) in sorted(counters.items()):
+        lines += [
+            f"# HELP {_key(name)}_total {help}",
+            f"# TYPE {_key(name)}_total counter",
+            f"{_key(name)}_total{{{label}}} {value}",
+        ]
+    for name in sorted({name for name, _ in histograms}):
+        metric = f"{_key(name)}_seconds"
+        lines += [f"# HELP {metric} {_histogram_help[name]}", f"# TYPE {metric} histogram"]
+        for (hist_name, stage), values in sorted(histograms.items()):
+            if hist_name != name:
+                continue
+            labels = f'{label},stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), values):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{labels}}} {values[-2]}")
+            lines.append(f"{metric}_count{{{labels}}} {values[-1]}")
+    described = set()
+    for (name, extra), (help, callback) in sorted(gauges.items()):
+        try:
+            value = float(callback())
+        except Exception:
+            continue
+        if name not in described:
+            described.add(name)
+            lines += [f"# HELP {_key(name)} {help}", f"# TYPE {_key(name)} gauge"]
+        labels = label + "".join(f',{key}="{text}"' for key, text in extra)
+        lines.append(f"{_key(name)}{{{labels}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(process, port=None):
+    """Label this process's metrics and serve them on its /metrics port."""
+    global _process
+    _process = process
+    if port is None:
+        if not METRICS_PORT:
+            return None
+        port = METRICS_PORT + PROCESS_PORTS.get(process, len(PROCESS_PORTS))
+    try:
+        server = ThreadingHTTPServer((METRICS_HOST, port), MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint for {process} disabled: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics for {process} at http://{METRICS_HOST}:{port}/metrics")
+    return server
+
+
+def run_with_metrics(process, target, *args):
+    """Process entry point: start the metrics endpoint, then run `target`."""
+    serve(process)
+    return target(*args)
@@ -1,5 +1,4 @@
 import cv2
-import numpy as np
 import os
 import requests
 import time
@@ -7,6 +6,14 @@ import logging
 from dotenv import load_dotenv
 from datetime import datetime
 import threading
+import async_writer
+import metrics
+import retention
+import stage_timing
+from async_writer import AsyncVideoWriter
+from motion_gate import MotionGate
+from preview import PreviewPublisher
+from threaded_capture import LatestFrameCapture
 
 # Set up logging
 logging.basicConfig(
@@ -30,7 +37,7 @@ class Config:
     VIDEO_URL = os.getenv("VIDEO_URL")
     
     # File storage
-    VIDEO_DIR = "videos/motion"
+    VIDEO_DIR = os.getenv("MOTION_DIR", "videos/motion")
     
     # Motion detection parameters
     MIN_AREA = 500  # Minimum contour area to consider as motion
@@ -39,7 +46,6 @@ class Config:
     # Recording parameters
     MIN_RECORD_SECONDS = 30
     FPS = 20.0
-    RETENTION_DAYS = 14
     
     # Background subtraction parameters
     HISTORY = 200
@@ -77,25 +83,9 @@ def send_video_to_telegram(video_path):
     threading.Thread(target=send_async).start()
 
 
-def cleanup_old_videos(days=Config.RETENTION_DAYS):
-    """Delete videos older than specified days."""
-    try:
-        now = time.time()
-        count = 0
-        for filename in os.listdir(Config.VIDEO_DIR):
-            file_path = os.path.join(Config.VIDEO_DIR, filename)
-            if os.path.isfile(file_path) and filename.startswith("motion_"):
-                file_time = os.path.getmtime(file_path)
-                if now - file_time > days * 86400:  # days in seconds
-                    os.remove(file_path)
-                    count += 1
-        logger.info(f"Deleted {count} old videos")
-    except Exception as e:
-        logger.error(f"Error cleaning up videos: {str(e)}")
-
-
 class MotionDetector:
-    def __init__(self):
+    def __init__(self, video_url=None):
+        self.video_url = video_url or Config.VIDEO_URL
         self.cap = None
         self.video_writer = None
         self.recording = False
@@ -104,14 +94,18 @@ class MotionDetector:
         self.height = 0
         self.width = 0
         self.backSub = None
+        self.gate = None
+        # Annotated frames and the foreground mask, published only while watched
+        self.preview = PreviewPublisher("motion")
+        self.mask_preview = PreviewPublisher("motion_mask")
         
     def initialize(self):
         # Check for valid video URL
-        if not Config.VIDEO_URL:
+        if not self.video_url:
             logger.error("VIDEO_URL not found in environment variables")
             return False
 
-        self.cap = cv2.VideoCapture(Config.VIDEO_URL)
+        self.cap = LatestFrameCapture(self.video_url)
         if not self.cap.isOpened():
             logger.error("Cannot connect to camera")
             return False
@@ -125,46 +119,27 @@ class MotionDetector:
         self.height, self.width = frame.shape[:2]
         
         # Create background subtractor
-        self.backSub = cv2.createBackgroundSubtractorMOG2(
-            history=Config.HISTORY, 
-            varThreshold=Config.VAR_THRESHOLD, 
-            detectShadows=True
+        self.gate = MotionGate(
+            history=Config.HISTORY,
+            var_threshold=Config.VAR_THRESHOLD,
+            min_area=Config.MIN_AREA,
         )
+        self.backSub = self.gate.backSub
         
         return True
         
     def process_frame(self, frame):
-        """Process a single frame and return motion information."""
-        # Create a copy for display
+        """Process a single frame and return (fg_mask, boxes, motion_percentage)."""
+        # Background subtraction, noise removal and contour extraction
+        return self.gate.apply(frame)
+
+    def annotate(self, frame, boxes, motion_percentage):
+        """Draw motion boxes, the motion level and the recording state on a copy."""
         display_frame = frame.copy()
         
-        # Apply background subtraction
-        fg_mask = self.backSub.apply(frame)
-        
-        # Remove shadows (gray pixels) and keep only white pixels (motion)
-        _, fg_mask = cv2.threshold(fg_mask, 250, 255, cv2.THRESH_BINARY)
-        
-        # Apply morphological operations to remove noise
-        kernel = np.ones((5, 5), np.uint8)
-        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, kernel)
-        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, kernel)
-        
-        # Find contours of moving objects
-        contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        total_motion_area = 0
-        
         # Process detected contours
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area > Config.MIN_AREA:
-                x, y, w, h = cv2.boundingRect(contour)
-                cv2.rectangle(display_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                total_motion_area += area
-        
-        # Calculate percentage of frame with motion
-        frame_area = self.height * self.width
-        motion_percentage = (total_motion_area / frame_area) * 100
+        for x, y, w, h in boxes:
+            cv2.rectangle(display_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
         
         # Add motion percentage text to the frame
         cv2.putText(
@@ -176,19 +151,32 @@ class MotionDetector:
             (0, 0, 255),
             2
         )
+
+        if self.recording:
+            # Add recording indicator
+            cv2.putText(
+                display_frame,
+                "RECORDING",
+                (self.width - 150, 30),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.7,
+                (0, 0, 255),
+                2
+            )
         
-        return display_frame, fg_mask, motion_percentage
+        return display_frame
     
     def start_recording(self):
         """Start recording a video."""
         self.recording = True
         self.record_end_time = time.time() + Config.MIN_RECORD_SECONDS
         self.video_filename = get_video_filename()
-        self.video_writer = cv2.VideoWriter(
+        self.video_writer = AsyncVideoWriter(
             self.video_filename, 
             cv2.VideoWriter_fourcc(*"XVID"), 
             Config.FPS, 
-            (self.width, self.height)
+            (self.width, self.height),
+            kind="motion",
         )
         logger.info(f"Recording started: {self.video_filename}")
         
@@ -200,10 +188,10 @@ class MotionDetector:
     def stop_recording(self):
         """Stop recording and send the video."""
         if self.video_writer:
-            self.video_writer.release()
+            # Sent from the writer thread once the file is complete
+            self.video_writer.release(on_close=send_video_to_telegram)
             self.video_writer = None
             logger.info(f"Recording stopped: {self.video_filename}")
-            send_video_to_telegram(self.video_filename)
             self.recording = False
     
     def run(self):
@@ -220,11 +208,13 @@ class MotionDetector:
                     logger.error("Failed to grab frame")
                     # Try to reconnect
                     time.sleep(5)
-                    self.cap = cv2.VideoCapture(Config.VIDEO_URL)
+                    self.cap.release()
+                    self.cap = LatestFrameCapture(self.video_url)
                     continue
                     
                 # Process the frame
-                display_frame, fg_mask, motion_percentage = self.process_frame(frame)
+                with stage_timing.timed("motion"):
+                    fg_mask, boxes, motion_percentage = self.process_frame(frame)
                 
                 current_time = time.time()
                 
@@ -238,30 +228,25 @@ class MotionDetector:
                         self.extend_recording()
 
                 if self.recording:
-                    # Add recording indicator
-                    cv2.putText(
-                        display_frame,
-                        "RECORDING",
-                        (self.width - 150, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.7,
-                        (0, 0, 255),
-                        2
-                    )
-                    self.video_writer.write(frame)  # Save original frame without annotations
+                    with stage_timing.timed("write"):
+                        self.video_writer.write(frame)  # Save original frame without annotations
                     
                     if current_time >= self.record_end_time:
                         self.stop_recording()
 
-                # Show the resulting frame with motion indicators
-                cv2.imshow("Motion Detection", display_frame)
-                
-                # Show the mask (helpful for debugging)
-                cv2.imshow("Motion Mask", fg_mask)
+                self.cap.mark_decision()
+                report = self.cap.report_due()
+                if report:
+                    logger.info(report)
+                    logger.info(async_writer.format_stats())
 
-                # Press 'q' to exit
-                if cv2.waitKey(1) & 0xFF == ord("q"):
-                    break
+                # Annotate and publish only while someone is watching the preview
+                if self.preview.wanted():
+                    self.preview.publish(self.annotate(frame, boxes, motion_percentage))
+                
+                # The mask is helpful for tuning the motion parameters
+                if self.mask_preview.wanted():
+                    self.mask_preview.publish(fg_mask)
                     
         except KeyboardInterrupt:
             logger.info("Motion detection stopped by user")
@@ -272,16 +257,18 @@ class MotionDetector:
             if self.cap:
                 self.cap.release()
             if self.recording and self.video_writer:
-                self.video_writer.release()
-            cv2.destroyAllWindows()
+                self.video_writer.release(wait=True)
+            self.preview.close()
+            self.mask_preview.close()
             
-            # Cleanup old videos
-            cleanup_old_videos()
+            # Apply age and space limits to the recordings
+            retention.enforce()
             logger.info("Motion detection stopped")
 
 
-def main():
-    detector = MotionDetector()
+def main(video_url=None):
+    metrics.serve("motion")
+    detector = MotionDetector(video_url)
     detector.run()
 
 
@@ -0,0 +1,62 @@
+import cv2
+import numpy as np
+
+# Defaults match motion_detection.Config
+HISTORY = 200
+VAR_THRESHOLD = 40
+MIN_AREA = 500  # Minimum contour area (full-resolution pixels) to count as motion
+
+
+class MotionGate:
+    """Cheap MOG2 motion stage shared by the motion detector and the cascade.
+
+    `apply()` returns the foreground mask, the bounding boxes of moving
+    regions in frame coordinates and the percentage of the frame in motion.
+    With `width` set, the background model runs on a downscaled copy of the
+    frame, which is much cheaper on high-resolution cameras.
+    """
+
+    def __init__(self, history=HISTORY, var_threshold=VAR_THRESHOLD, min_area=MIN_AREA, width=None):
+        self.backSub = cv2.createBackgroundSubtractorMOG2(
+            history=history, varThreshold=var_threshold, detectShadows=True
+        )
+        self.min_area = min_area
+        self.width = width
+        self.kernel = np.ones((5, 5), np.uint8)
+
+    def apply(self, frame):
+        (h, w) = frame.shape[:2]
+        scale = 1.0
+        small = frame
+        if self.width and w > self.width:
+            scale = self.width / w
+            small = cv2.resize(frame, (self.width, int(h * scale)), interpolation=cv2.INTER_AREA)
+
+        # Apply background subtraction
+        fg_mask = self.backSub.apply(small)
+
+        # Remove shadows (gray pixels) and keep only white pixels (motion)
+        _, fg_mask = cv2.threshold(fg_mask, 250, 255, cv2.THRESH_BINARY)
+
+        # Apply morphological operations to remove noise
+        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, self.kernel)
+        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, self.kernel)
+
+        # Find contours of moving objects
+        contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        min_area = self.min_area * scale * scale
+        boxes = []
+        total_motion_area = 0
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area > min_area:
+                x, y, bw, bh = cv2.boundingRect(contour)
+                boxes.append(
+                    (int(x / scale), int(y / scale), int(bw / scale), int(bh / scale))
+                )
+                total_motion_area += area
+
+        # Calculate percentage of frame with motion
+        motion_percentage = (total_motion_area / (fg_mask.shape[0] * fg_mask.shape[1])) * 100
+        return fg_mask, boxes, motion_percentage
@@ -1,9 +1,7 @@
-import requests
-import cv2
 import datetime
 import os
-import time
 from dotenv import load_dotenv
+from uploader import get_uploader
 
 load_dotenv()
 
@@ -11,38 +9,31 @@ SERVER_URL = os.getenv("SERVER_URL")
 CHAT_ID = os.getenv("CHAT_ID")
 
 
-def notify_server(image_path):
-    global CHAT_ID
-    global SERVER_URL
-
-    with open(image_path, "rb") as img_file:
-        files = {"file": (os.path.basename(image_path), img_file, "image/jpeg")}
-        data = {"user_id": CHAT_ID, "timestamp": str(datetime.datetime.now())}
-
-        try:
-            response = requests.post(
-                f"{SERVER_URL}/api/detect-human/send-image",
-                files=files,
-                data=data,
-            )
-            print(f"Server Response: {response.text}")
-        except Exception as e:
-            print(f"Failed to notify server : {e}")
-
-
-def notify_server_video(video_path):
-    global CHAT_ID
-    global SERVER_URL
-
-    with open(video_path, "rb") as video_file:
-        files = {"file": (os.path.basename(video_path), video_file, "video/x-msvideo")}
-        data = {"user_id": CHAT_ID, "timestamp": str(datetime.datetime.now())}
-        try:
-            response = requests.post(
-                f"{SERVER_URL}/api/detect-human/send-video",
-                files=files,
-                data=data,
-            )
-            print(f"Server Response: {response.text}")
-        except Exception as e:
-            print(f"Failed to notify server : {e}")
+def notify_server(image_path, delay=0.0):
+    """Queue a detection snapshot for upload; returns immediately."""
+    data = {"user_id": CHAT_ID, "timestamp": str(datetime.datetime.now())}
+    get_uploader().enqueue(
+        f"{SERVER_URL}/api/detect-human/send-image", image_path, "image/jpeg", data, delay
+    )
+
+
+def notify_server_images(image_paths, events, first, last, camera):
+    """Queue several snapshots of `events` detections for upload as one album."""
+    data = {
+        "user_id": CHAT_ID,
+        "timestamp": str(datetime.datetime.fromtimestamp(first)),
+        "last": str(datetime.datetime.fromtimestamp(last)),
+        "events": str(events),
+        "camera": camera,
+    }
+    get_uploader().enqueue(
+        f"{SERVER_URL}/api/detect-human/send-images", list(image_paths), "image/jpeg", data
+    )
+
+
+def notify_server_video(video_path, delay=0.0):
+    """Queue a detection clip for upload; returns immediately."""
+    data = {"user_id": CHAT_ID, "timestamp": str(datetime.datetime.now())}
+    get_uploader().enqueue(
+        f"{SERVER_URL}/api/detect-human/send-video", video_path, "video/x-msvideo", data, delay
+    )
@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PREROLL_SECONDS = float(os.getenv("PREROLL_SECONDS", "5"))
+PREROLL_MAX_MB = float(os.getenv("PREROLL_MAX_MB", "32"))
+PREROLL_QUALITY = int(os.getenv("PREROLL_QUALITY", "80"))  # JPEG quality
+
+
+class PrerollBuffer:
+    """Last few seconds of video kept as JPEG bytes under a fixed memory cap.
+
+    Frames older than `seconds`, and the oldest frames whenever the total
+    size would exceed `max_bytes`, are dropped. `drain()` decodes what is left
+    one frame at a time, in capture order, so it can be written at the start
+    of a clip without holding more than one raw frame.
+    """
+
+    def __init__(self, seconds=PREROLL_SECONDS, max_mb=PREROLL_MAX_MB, quality=PREROLL_QUALITY):
+        self.seconds = seconds
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.frames = deque()  # (timestamp, jpeg bytes)
+        self.bytes = 0
+
+        # Stats
+        self.encoded = 0
+        self.encode_total = 0.0
+        self.evicted = 0
+
+    def push(self, frame, timestamp=None):
+        if self.seconds <= 0:
+            return
+        timestamp = timestamp or time.time()
+        start = time.time()
+        ok, buffer = cv2.imencode(".jpg", frame, self.params)
+        self.encode_total += time.time() - start
+        if not ok:
+            return
+        data = buffer.tobytes()
+        self.encoded += 1
+        self.frames.append((timestamp, data))
+        self.bytes += len(data)
+
+        while self.frames and (
+            self.bytes > self.max_bytes or timestamp - self.frames[0][0] > self.seconds
+        ):
+            _, old = self.frames.popleft()
+            self.bytes -= len(old)
+            self.evicted += 1
+
+    def drain(self, with_timestamps=False):
+        """Yield the buffered frames decoded one by one, oldest first, emptying the buffer.
+
+        With `with_timestamps` the items are (capture time, frame) pairs.
+        """
+        while self.frames:
+            timestamp, data = self.frames.popleft()
+            self.bytes -= len(data)
+            frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None:
+                yield (timestamp, frame) if with_timestamps else frame
+
+    def stats(self):
+        span = self.frames[-1][0] - self.frames[0][0] if len(self.frames) > 1 else 0.0
+        return {
+            "frames": len(self.frames),
+            "seconds": span,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "avg_encode_ms": self.encode_total / self.encoded * 1000 if self.encoded else 0.0,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,63 @@
+import os
+import time
+from dotenv import load_dotenv
+from frame_buffer import BUFFER_NAME, SHM_PREFIX, FrameRingBuffer
+
+load_dotenv()
+
+PREVIEW_FPS = float(os.getenv("PREVIEW_FPS", "5"))  # 0 disables previews
+PREVIEW_IDLE = 5  # Seconds after the last viewer read before publishing stops
+PREVIEW_SLOTS = 4
+# Views the pipelines publish; live_server.py serves them at /preview/<camera>/<view>
+PREVIEW_VIEWS = ("continuous", "detection", "motion", "motion_mask")
+
+
+def preview_name(view, buffer_name=BUFFER_NAME):
+    """Ring of `view` for the camera whose frame buffer is `buffer_name`."""
+    return f"{buffer_name}_{view}"
+
+
+def preview_url(view, buffer_name=BUFFER_NAME):
+    return f"{SHM_PREFIX}{preview_name(view, buffer_name)}"
+
+
+class PreviewPublisher:
+    """Publish one view of a pipeline (annotated frames or a mask) for viewers.
+
+    Frames go into a small shared-memory ring that live_server.py streams as
+    MJPEG. Viewers mark the ring as wanted while they read it; `wanted()` is
+    False when nobody has looked for `PREVIEW_IDLE` seconds or the view was
+    published less than 1/`PREVIEW_FPS` ago, so callers can skip drawing too.
+    """
+
+    def __init__(self, view, fps=PREVIEW_FPS):
+        self.view = view
+        self.interval = 1.0 / fps if fps > 0 else None
+        self.buffer = None
+        self.last_publish = 0.0
+        self.published = 0
+
+    def wanted(self):
+        if self.interval is None:
+            return False
+        if time.time() - self.last_publish < self.interval:
+            return False
+        # The ring is created by the first publish, so viewers can attach to it
+        return self.buffer is None or self.buffer.demand_age < PREVIEW_IDLE
+
+    def publish(self, frame):
+        if self.buffer is None:
+            try:
+                self.buffer = FrameRingBuffer.create(preview_name(self.view), frame.shape, PREVIEW_SLOTS)
+            except OSError as e:
+                print(f"Preview '{self.view}' disabled: {e}")
+                self.interval = None
+                return
+        self.buffer.write(frame)
+        self.last_publish = time.time()
+        self.published += 1
+
+    def close(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
@@ -0,0 +1,379 @@
+import argparse
+import bisect
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", "videos/catalog.sqlite3")
+CAMERA_NAME = os.getenv("CAMERA_NAME", "default")
+FFPROBE = os.getenv("FFPROBE", "ffprobe")
+# Recording directories by kind, used to rebuild the catalog from disk
+VIDEO_DIRS = {
+    "continuous": os.getenv("CONTINUOUS_DIR", "videos/continuous"),
+    "detection": os.getenv("DETECTION_DIR", "videos/detection"),
+    "motion": os.getenv("MOTION_DIR", "videos/motion"),
+}
+VIDEO_EXTENSIONS = (".avi", ".mkv", ".mp4", ".ts")
+FILENAME_TIME = re.compile(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY,
+    camera TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    frames INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    keyframes TEXT NOT NULL,
+    timeline TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS recordings_start ON recordings (start);
+CREATE INDEX IF NOT EXISTS recordings_camera_kind_start ON recordings (camera, kind, start);
+CREATE INDEX IF NOT EXISTS recordings_kind_end ON recordings (kind, end);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL);
+"""
+
+
+def connect(path=CATALOG_PATH):
+    """Open the catalog, creating it if needed. Safe to use from several processes."""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    db = sqlite3.connect(path, timeout=30)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(_SCHEMA)
+    columns = {row["name"] for row in db.execute("PRAGMA table_info(recordings)")}
+    if "timeline" not in columns:
+        # Catalogs created before the wall-to-media timeline was stored
+        db.execute("ALTER TABLE recordings ADD COLUMN timeline TEXT NOT NULL DEFAULT '[]'")
+    return db
+
+
+def filename_time(path):
+    """Start time encoded in a recording's filename, or None."""
+    match = FILENAME_TIME.search(os.path.basename(path))
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), "%Y-%m-%d_%H-%M-%S").timestamp()
+
+
+def probe(path, with_pts=False):
+    """Frame count and keyframe offsets (media seconds) of a file, via ffprobe.
+
+    Only packets are read, nothing is decoded. With `with_pts`, the sorted
+    media time of every frame is returned as well. Returns None if ffprobe
+    is missing or cannot read the file.
+    """
+    try:
+        output = subprocess.run(
+            [
+                FFPROBE, "-v", "error", "-select_streams", "v:0",
+                "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path,
+            ],
+            capture_output=True,
+            text=True,
+            timeout=300,
+        ).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    frames = 0
+    keyframes = []
+    times = []
+    for line in output.splitlines():
+        fields = line.split(",")
+        if len(fields) < 2:
+            continue
+        frames += 1
+        try:
+            pts = float(fields[0])
+        except ValueError:
+            continue
+        times.append(pts)
+        if "K" in fields[1]:
+            keyframes.append(pts)
+    if not frames:
+        return None
+    # Packets come in decode order; the earliest presentation time is media zero
+    first = min(times) if times else 0.0
+    keyframes = sorted(round(pts - first, 3) for pts in keyframes)
+    if with_pts:
+        return frames, keyframes, sorted(round(pts - first, 3) for pts in times)
+    return frames, keyframes
+
+
+def read_timecodes(path):
+    """Wall-clock offsets (seconds) of the frames listed in a recording's timecode sidecar."""
+    sidecar = os.path.splitext(path)[0] + ".timestamps.txt"
+    if not os.path.exists(sidecar):
+        return None
+    offsets = []
+    with open(sidecar) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                offsets.append(float(line) / 1000)
+    return offsets
+
+
+def build_timeline(walls, media, interval=1.0, gap=None):
+    """Compact (wall offset, media time) points for frames at `walls` / `media`.
+
+    A point is kept at least every `interval` wall seconds and on both sides
+    of every gap longer than `gap` seconds between frames, so linear
+    interpolation between points maps wall-clock time to media time.
+    """
+    timeline = []
+    for i, (wall, media_time) in enumerate(zip(walls, media)):
+        if timeline and gap is not None and wall - walls[i - 1] > gap and timeline[-1][1] < media[i - 1]:
+            timeline.append((round(walls[i - 1], 3), round(media[i - 1], 3)))
+        if not timeline or wall - timeline[-1][0] >= interval or (gap is not None and wall - walls[i - 1] > gap):
+            timeline.append((round(wall, 3), round(media_time, 3)))
+    return timeline
+
+
+def media_offset(timeline, offset, duration=None):
+    """Media time shown `offset` wall-clock seconds into a recording.
+
+    Without a timeline the file is assumed to play in real time, and so is
+    the stretch after its last point; clamp to `duration` when it is known.
+    """
+    if not timeline:
+        return offset if duration is None else min(offset, duration)
+    index = bisect.bisect_right([point[0] for point in timeline], offset)
+    if index == 0:
+        return timeline[0][1]
+    wall, media = timeline[index - 1]
+    if index == len(timeline):
+        # Past the last point: frames run on in real time from there
+        media += offset - wall
+        return media if duration is None else min(media, duration)
+    next_wall, next_media = timeline[index]
+    return media + (offset - wall) * (next_media - media) / (next_wall - wall)
+
+
+def add(path, kind, start, end, frames, keyframes=(), camera=CAMERA_NAME, catalog=CATALOG_PATH, timeline=()):
+    """Record a closed segment; replaces any earlier entry for the same path.
+
+    `timeline` maps wall-clock offsets from `start` to media time (see
+    `build_timeline`) for files whose frames were dropped or thinned.
+    """
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    db = connect(catalog)
+    try:
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO recordings "
+                "(path, camera, kind, start, end, frames, size, keyframes, timeline) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path, camera, kind, start, end, frames, size,
+                    json.dumps(list(keyframes)), json.dumps([list(p) for p in timeline]),
+                ),
+            )
+            # Longest recording so far bounds the range scans in between()
+            db.execute(
+                "INSERT INTO meta VALUES ('max_duration', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = max(value, excluded.value)",
+                (end - start,),
+            )
+    finally:
+        db.close()
+
+
+def add_file(path, kind, start=None, end=None, camera=CAMERA_NAME, catalog=CATALOG_PATH):
+    """Catalogue a finished file from its name, mtime and an ffprobe scan."""
+    start = start or filename_time(path) or os.path.getmtime(path)
+    end = end or os.path.getmtime(path)
+    frames, keyframes, pts = probe(path, with_pts=True) or (0, [], [])
+    timeline = ()
+    walls = read_timecodes(path)
+    if walls and pts:
+        # Adaptive segments: the sidecar has the capture time of each written frame
+        count = min(len(walls), len(pts))
+        timeline = build_timeline(walls[:count], pts[:count], gap=1.0)
+    add(path, kind, start, max(start, end), frames, keyframes, camera, catalog, timeline)
+
+
+def remove(paths, catalog=CATALOG_PATH):
+    """Forget one path or a batch of paths in a single transaction."""
+    if isinstance(paths, str):
+        paths = [paths]
+    db = connect(catalog)
+    try:
+        with db:
+            db.executemany("DELETE FROM recordings WHERE path = ?", [(p,) for p in paths])
+    finally:
+        db.close()
+
+
+def usage(catalog=CATALOG_PATH, by="kind"):
+    """Catalogued bytes per kind, or per camera with `by="camera"`."""
+    if by not in ("kind", "camera"):
+        raise ValueError(f"Cannot group usage by '{by}'")
+    db = connect(catalog)
+    try:
+        rows = db.execute(f"SELECT {by} AS key, SUM(size) AS size FROM recordings GROUP BY {by}")
+        return {row["key"]: row["size"] or 0 for row in rows}
+    finally:
+        db.close()
+
+
+def oldest(kind, limit, ended_before=None, catalog=CATALOG_PATH, camera=None):
+    """Up to `limit` recordings of one kind, oldest first, optionally of one camera."""
+    clauses, params = ["kind = ?"], [kind]
+    if ended_before is not None:
+        clauses.append("end < ?")
+        params.append(ended_before)
+    if camera is not None:
+        clauses.append("camera = ?")
+        params.append(camera)
+    db = connect(catalog)
+    try:
+        rows = db.execute(
+            f"SELECT path, size, end FROM recordings WHERE {' AND '.join(clauses)} "
+            "ORDER BY end LIMIT ?",
+            params + [limit],
+        )
+        return [dict(row) for row in rows]
+    finally:
+        db.close()
+
+
+def _row(row, at=None):
+    recording = dict(row)
+    recording["keyframes"] = json.loads(recording["keyframes"])
+    timeline = json.loads(recording.pop("timeline") or "[]")
+    if at is not None:
+        # Keyframes are media times; convert the wall-clock offset first
+        recording["wall_offset"] = max(0.0, at - recording["start"])
+        offset = media_offset(timeline, recording["wall_offset"])
+        recording["offset"] = offset
+        # Players seek to the last keyframe at or before the offset
+        index = bisect.bisect_right(recording["keyframes"], offset)
+        recording["seek"] = recording["keyframes"][index - 1] if index else 0.0
+    return recording
+
+
+def _filters(camera, kind):
+    clauses, params = [], []
+    if camera is not None:
+        clauses.append("camera = ?")
+        params.append(camera)
+    if kind is not None:
+        clauses.append("kind = ?")
+        params.append(kind)
+    return "".join(f" AND {c}" for c in clauses), params
+
+
+def lookup(at, camera=None, kind=None, catalog=CATALOG_PATH):
+    """Recording covering time `at`, with media `offset` and keyframe `seek` seconds.
+
+    An index seek on start time finds the latest recordings that began at or
+    before `at`; returns None if none of them is still running at `at`.
+    """
+    where, params = _filters(camera, kind)
+    db = connect(catalog)
+    try:
+        rows = db.execute(
+            f"SELECT * FROM recordings WHERE start <= ?{where} ORDER BY start DESC LIMIT 8",
+            [at] + params,
+        ).fetchall()
+    finally:
+        db.close()
+    for row in rows:
+        if row["end"] >= at:
+            return _row(row, at)
+    return None
+
+
+def between(start, end, camera=None, kind=None, catalog=CATALOG_PATH):
+    """Recordings overlapping [start, end], oldest first."""
+    where, params = _filters(camera, kind)
+    db = connect(catalog)
+    try:
+        meta = db.execute("SELECT value FROM meta WHERE key = 'max_duration'").fetchone()
+        earliest = start - (meta["value"] if meta else 0.0)
+        rows = db.execute(
+            f"SELECT * FROM recordings WHERE start >= ? AND start <= ? AND end >= ?{where} "
+            "ORDER BY start",
+            [earliest, end, start] + params,
+        ).fetchall()
+    finally:
+        db.close()
+    return [_row(row) for row in rows]
+
+
+def rebuild(catalog=CATALOG_PATH, camera=CAMERA_NAME, dirs=None):
+    """Catalogue every recording on disk that is not in the catalog yet.
+
+    `dirs` maps kinds to directories and defaults to `VIDEO_DIRS`.
+    """
+    db = connect(catalog)
+    try:
+        known = {row["path"] for row in db.execute("SELECT path FROM recordings")}
+    finally:
+        db.close()
+    added = 0
+    for kind, directory in (dirs or VIDEO_DIRS).items():
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            path = os.path.join(directory, filename)
+            if path in known or not filename.endswith(VIDEO_EXTENSIONS):
+                continue
+            add_file(path, kind, camera=camera, catalog=catalog)
+            added += 1
+    return added
+
+
+def parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or rebuild the recording catalog")
+    parser.add_argument("--rebuild", action="store_true", help="add recordings found on disk")
+    parser.add_argument("--at", help="find the recording covering this time (ISO or epoch)")
+    parser.add_argument("--start", help="list recordings from this time")
+    parser.add_argument("--end", help="list recordings up to this time (default now)")
+    parser.add_argument("--camera")
+    parser.add_argument("--kind", choices=list(VIDEO_DIRS))
+    args = parser.parse_args()
+
+    if args.rebuild:
+        start = time.time()
+        print(f"Catalogued {rebuild()} recordings in {time.time() - start:.1f} s")
+    if args.at:
+        recording = lookup(parse_time(args.at), args.camera, args.kind)
+        if recording is None:
+            print("Nothing recorded at that time")
+        else:
+            print(
+                f"{recording['path']} offset {recording['offset']:.1f} s "
+                f"(seek to keyframe at {recording['seek']:.1f} s)"
+            )
+    if args.start:
+        end = parse_time(args.end) if args.end else time.time()
+        for recording in between(parse_time(args.start), end, args.camera, args.kind):
+            print(
+                f"{datetime.fromtimestamp(recording['start'])}  "
+                f"{recording['end'] - recording['start']:>7.0f} s  {recording['kind']:<10} "
+                f"{recording['frames']:>7} frames  {recording['size'] / 1048576:>8.1f} MB  "
+                f"{recording['path']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
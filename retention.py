@@ -0,0 +1,208 @@
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+import metrics
+import recording_catalog
+
+load_dotenv()
+
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "14"))  # Continuous footage
+EVENT_RETENTION_DAYS = float(os.getenv("EVENT_RETENTION_DAYS", str(RETENTION_DAYS)))  # Motion/detection clips
+# Byte quotas in GB: per kind as "continuous=200,detection=20", and in total;
+# 0 or missing means no quota
+RETENTION_QUOTAS = os.getenv("RETENTION_QUOTAS", "")
+# Per camera in GB over all its kinds, as "front=100,garage=50"; "*" applies to
+# every camera not listed, so one busy camera cannot evict the others' footage
+RETENTION_CAMERA_QUOTAS = os.getenv("RETENTION_CAMERA_QUOTAS", "")
+RETENTION_TOTAL_GB = float(os.getenv("RETENTION_TOTAL_GB", "0"))
+MIN_FREE_GB = float(os.getenv("MIN_FREE_GB", "1"))  # Free space to keep on the video disk
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "60"))  # Seconds between passes
+EVICTION_BATCH = 20  # Files deleted per transaction
+MAX_EVICTIONS_PER_PASS = 500
+REPORT_PASSES = 60  # Print stats at least this often even when nothing was evicted
+VIDEO_ROOT = os.path.dirname(recording_catalog.CATALOG_PATH) or "."
+# Evicted first under space pressure: continuous footage, then motion, then detection clips
+EVICTION_ORDER = ("continuous", "motion", "detection")
+GB = 1024 ** 3
+
+_lock = threading.Lock()  # One pass at a time per process
+_totals = {"files": 0, "bytes": 0, "seconds": 0.0, "passes": 0}
+
+
+def parse_quotas(spec=RETENTION_QUOTAS):
+    """Parse RETENTION_QUOTAS (or RETENTION_CAMERA_QUOTAS) into {kind: bytes}."""
+    quotas = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        try:
+            kind, gb = part.split("=")
+            quotas[kind.strip()] = int(float(gb) * GB)
+        except ValueError:
+            print(f"Ignoring invalid retention quota: {part}")
+    return quotas
+
+
+def free_bytes(path=VIDEO_ROOT):
+    return shutil.disk_usage(path).free
+
+
+def _evict(rows, reason):
+    """Delete a batch of recordings and their catalog entries; returns bytes freed."""
+    freed = 0
+    for row in rows:
+        for path in (row["path"], os.path.splitext(row["path"])[0] + ".timestamps.txt"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error deleting {path}: {e}")
+        freed += row["size"]
+    recording_catalog.remove([row["path"] for row in rows])
+    metrics.inc("evicted_files", len(rows), "Recordings deleted by retention")
+    metrics.inc("evicted_bytes", freed, "Bytes freed by retention")
+    print(f"[{datetime.now()}] Retention: deleted {len(rows)} recordings ({freed / 1048576:.0f} MB, {reason})")
+    return freed, len(rows)
+
+
+def enforce(now=None, quotas=None, camera_quotas=None):
+    """Run one retention pass over the catalog; returns a stats dict.
+
+    Recordings past their age limit go first. Then, oldest first and in small
+    batches, a camera over its quota loses its own files (continuous footage
+    first), a kind over its quota loses its own files, and while the total
+    is over quota or free space is below `MIN_FREE_GB`, continuous footage is
+    evicted before motion clips and motion clips before detection clips.
+    """
+    if not _lock.acquire(blocking=False):
+        return None
+    try:
+        return _enforce(
+            now or time.time(),
+            parse_quotas() if quotas is None else quotas,
+            parse_quotas(RETENTION_CAMERA_QUOTAS) if camera_quotas is None else camera_quotas,
+        )
+    finally:
+        _lock.release()
+
+
+def _enforce(now, quotas, camera_quotas):
+    start = time.time()
+    files = freed = 0
+
+    def run(kind, limit, reason, ended_before=None, camera=None, excess=None):
+        """Evict one batch, stopping once `excess` bytes are covered; returns
+        (bytes, files), files 0 once no candidates remain."""
+        nonlocal files, freed
+        rows = recording_catalog.oldest(kind, limit, ended_before, camera=camera)
+        if excess is not None:
+            needed = 0
+            for needed, row in enumerate(rows, 1):
+                excess -= row["size"]
+                if excess <= 0:
+                    break
+            rows = rows[:needed]
+        if not rows:
+            return 0, 0
+        size, count = _evict(rows, reason)
+        files += count
+        freed += size
+        return size, count
+
+    def batch():
+        return min(EVICTION_BATCH, MAX_EVICTIONS_PER_PASS - files)
+
+    # Age limits
+    for kind in EVICTION_ORDER:
+        days = RETENTION_DAYS if kind == "continuous" else EVENT_RETENTION_DAYS
+        while files < MAX_EVICTIONS_PER_PASS and run(
+            kind, batch(), f"older than {days:g} days", now - days * 86400
+        )[1]:
+            pass
+
+    # Per-camera quotas; a batch of already-deleted files frees nothing but
+    # still makes progress, so only running out of candidates stops a loop
+    camera_usage = recording_catalog.usage(by="camera")
+    for camera, size in camera_usage.items():
+        quota = camera_quotas.get(camera, camera_quotas.get("*"))
+        for kind in EVICTION_ORDER:
+            while quota and size > quota and files < MAX_EVICTIONS_PER_PASS:
+                evicted, count = run(
+                    kind, batch(), f"camera {camera} over quota", camera=camera, excess=size - quota
+                )
+                if not count:
+                    break
+                size -= evicted
+
+    # Per-kind quotas
+    usage = recording_catalog.usage()
+    for kind, quota in quotas.items():
+        while quota and usage.get(kind, 0) > quota and files < MAX_EVICTIONS_PER_PASS:
+            size, count = run(kind, batch(), f"{kind} over quota", excess=usage[kind] - quota)
+            if not count:
+                break
+            usage[kind] -= size
+
+    # Total quota and free-space headroom
+    def pressure():
+        over_total = RETENTION_TOTAL_GB and sum(usage.values()) > RETENTION_TOTAL_GB * GB
+        return over_total or free_bytes() < MIN_FREE_GB * GB
+
+    for kind in EVICTION_ORDER:
+        while files < MAX_EVICTIONS_PER_PASS and pressure():
+            size, count = run(kind, batch(), "low on space")
+            if not count:
+                break
+            usage[kind] = usage.get(kind, 0) - size
+
+    elapsed = time.time() - start
+    _totals["files"] += files
+    _totals["bytes"] += freed
+    _totals["seconds"] += elapsed
+    _totals["passes"] += 1
+    return {
+        "evicted_files": files,
+        "evicted_bytes": freed,
+        "seconds": elapsed,
+        "files_per_s": files / elapsed if elapsed else 0.0,
+        "mb_per_s": freed / 1048576 / elapsed if elapsed else 0.0,
+        "free_gb": free_bytes() / GB,
+        "headroom_gb": free_bytes() / GB - MIN_FREE_GB,
+        "usage_gb": {kind: size / GB for kind, size in usage.items()},
+    }
+
+
+def format_stats(stats):
+    usage = ", ".join(f"{kind} {gb:.1f} GB" for kind, gb in sorted(stats["usage_gb"].items()))
+    return (
+        f"Retention: evicted {stats['evicted_files']} files / {stats['evicted_bytes'] / 1048576:.0f} MB "
+        f"in {stats['seconds']:.2f} s ({stats['files_per_s']:.0f} files/s, {stats['mb_per_s']:.0f} MB/s), "
+        f"{stats['free_gb']:.1f} GB free ({stats['headroom_gb']:+.1f} GB headroom), {usage or 'nothing stored'}; "
+        f"{_totals['files']} files evicted in {_totals['passes']} passes"
+    )
+
+
+def run_retention(interval=RETENTION_INTERVAL):
+    """Retention service: adopt files already on disk once, then enforce periodically."""
+    metrics.gauge("disk_free_bytes", "Free space on the video disk", free_bytes)
+    added = recording_catalog.rebuild()
+    if added:
+        print(f"[{datetime.now()}] Retention: catalogued {added} existing recordings")
+    while True:
+        try:
+            stats = enforce()
+            if stats is not None and (
+                stats["evicted_files"] or stats["headroom_gb"] < 0 or _totals["passes"] % REPORT_PASSES == 1
+            ):
+                print(f"[{datetime.now()}] {format_stats(stats)}")
+        except Exception as e:
+            print(f"[{datetime.now()}] Retention error: {e}")
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    run_retention()
@@ -0,0 +1,137 @@
+import metrics
+import multiprocessing
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ADAPTIVE_SCHEDULER=1 lets run_human_detection pick its own detection stride
+# and DNN input size to stay inside the latency and CPU budget.
+ADAPTIVE_SCHEDULER = os.getenv("ADAPTIVE_SCHEDULER", "0") == "1"
+TARGET_LATENCY = float(os.getenv("SCHEDULER_TARGET_LATENCY", "0.25"))  # Seconds
+TARGET_CPU_SHARE = float(os.getenv("SCHEDULER_CPU_SHARE", "0.5"))  # Fraction of all cores
+INPUT_SIZES = (300, 260, 220)  # DNN input sizes, best first
+MAX_STRIDE = 8
+ADJUST_INTERVAL = 2.0  # Seconds between scheduling decisions
+BOOST_SECONDS = 5.0  # Keep the full rate this long after motion
+HEADROOM = 0.7  # Only step back up when below this fraction of the budget
+EWMA_ALPHA = 0.2
+
+
+def process_cpu():
+    """CPU seconds of this process plus its live children, e.g. inference workers."""
+    cpu = time.process_time()
+    for child in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{child.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # Fields after the command name: ..., utime (11), stime (12)
+            cpu += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, IndexError, ValueError):
+            continue  # Exited meanwhile, or no /proc on this platform
+    return cpu
+
+
+class AdaptiveScheduler:
+    """Choose detection stride and DNN input size from measured frame timings.
+
+    The loop reports how long it waited for each frame and how long inference
+    and write took, plus the end-to-end latency. Every `ADJUST_INTERVAL`
+    seconds the scheduler compares the averages and the CPU share of the
+    process and its inference workers against the targets: when over budget it first shrinks the input size, then runs the detector less
+    often; when comfortably under budget it undoes those steps in reverse.
+    While recording, or shortly after motion, the detector runs on every frame
+    regardless.
+    """
+
+    def __init__(self, target_latency=TARGET_LATENCY, target_cpu=TARGET_CPU_SHARE):
+        self.target_latency = target_latency
+        self.target_cpu = target_cpu
+        self.base_stride = 1
+        self.size_index = 0
+        self.boost_until = 0.0
+        self.timings = {"read_wait": 0.0, "inference": 0.0, "write": 0.0, "latency": 0.0}
+        self.cpu_share = 0.0
+        self.decisions = 0
+        self.last_decision = "start"
+        self.cpu_count = os.cpu_count() or 1
+        self.last_adjust = time.time()
+        self.last_cpu = process_cpu()
+        metrics.gauge("scheduler_stride", "Frames per detector run chosen by the scheduler", lambda: self.stride)
+        metrics.gauge("scheduler_input_size", "DNN input size chosen by the scheduler", lambda: self.input_size)
+        metrics.gauge("scheduler_boosted", "1 while motion or recording forces full rate", lambda: int(time.time() < self.boost_until))
+        metrics.gauge("scheduler_cpu_share", "CPU share of the detection process and its workers", lambda: self.cpu_share)
+        metrics.gauge("scheduler_decisions", "Stride and input size changes made by the scheduler", lambda: self.decisions)
+
+    @property
+    def stride(self):
+        if time.time() < self.boost_until:
+            return 1
+        return self.base_stride
+
+    @property
+    def input_size(self):
+        return INPUT_SIZES[self.size_index]
+
+    def boost(self):
+        """Run at full rate for a while (called on motion or while recording)."""
+        self.boost_until = time.time() + BOOST_SECONDS
+
+    def record(self, read_wait=None, inference=None, write=None, latency=None):
+        """Fold one frame's stage timings (seconds) into the running averages."""
+        for name, value in (
+            ("read_wait", read_wait),
+            ("inference", inference),
+            ("write", write),
+            ("latency", latency),
+        ):
+            if value is not None:
+                self.timings[name] += EWMA_ALPHA * (value - self.timings[name])
+        self._adjust()
+
+    def _adjust(self):
+        now = time.time()
+        elapsed = now - self.last_adjust
+        if elapsed < ADJUST_INTERVAL:
+            return
+        cpu = process_cpu()
+        self.cpu_share = max(0.0, cpu - self.last_cpu) / elapsed / self.cpu_count
+        self.last_adjust, self.last_cpu = now, cpu
+
+        latency = self.timings["latency"]
+        if latency > self.target_latency or self.cpu_share > self.target_cpu:
+            if self.size_index < len(INPUT_SIZES) - 1:
+                self.size_index += 1
+                self._decided(f"over budget, input size -> {self.input_size}")
+            elif self.base_stride < MAX_STRIDE:
+                self.base_stride += 1
+                self._decided(f"over budget, stride -> {self.base_stride}")
+        elif (
+            latency < self.target_latency * HEADROOM
+            and self.cpu_share < self.target_cpu * HEADROOM
+        ):
+            if self.base_stride > 1:
+                self.base_stride -= 1
+                self._decided(f"under budget, stride -> {self.base_stride}")
+            elif self.size_index > 0:
+                self.size_index -= 1
+                self._decided(f"under budget, input size -> {self.input_size}")
+
+    def _decided(self, decision):
+        self.decisions += 1
+        self.last_decision = decision
+
+    def metrics(self):
+        return {
+            "stride": self.stride,
+            "input_size": self.input_size,
+            "boosted": time.time() < self.boost_until,
+            "cpu_share": self.cpu_share,
+            "read_wait_ms": self.timings["read_wait"] * 1000,
+            "inference_ms": self.timings["inference"] * 1000,
+            "write_ms": self.timings["write"] * 1000,
+            "latency_ms": self.timings["latency"] * 1000,
+            "decisions": self.decisions,
+            "last_decision": self.last_decision,
+        }
@@ -0,0 +1,85 @@
+// app/api/detect-human/send-images/route.ts
+import { NextRequest, NextResponse } from 'next/server';
+import { rateLimited, takeAlertToken } from '@/lib/rate-limit';
+
+// Telegram accepts 2-10 photos per media group
+const MAX_ALBUM = 10;
+
+export async function POST(request: NextRequest) {
+    try {
+        const formData = await request.formData();
+        const files = (formData.getAll('file') as File[]).slice(0, MAX_ALBUM);
+        const userId = formData.get('user_id') as string;
+        const timestamp = formData.get('timestamp') as string;
+        const last = formData.get('last') as string;
+        const events = formData.get('events') as string;
+        const camera = formData.get('camera') as string;
+
+        if (files.length === 0) {
+            return NextResponse.json({ error: 'No image files uploaded' }, { status: 400 });
+        }
+
+        if (!userId) {
+            return NextResponse.json({ error: 'Missing user_id parameter' }, { status: 400 });
+        }
+
+        const wait = takeAlertToken(userId);
+        if (wait > 0) {
+            return rateLimited(wait);
+        }
+
+        const botToken = process.env.BOT_TOKEN;
+        if (!botToken) {
+            return NextResponse.json({ error: 'Bot token not configured' }, { status: 500 });
+        }
+
+        // One message for every detection the camera batched together
+        const where = camera && camera !== 'default' ? ` on ${camera}` : '';
+        const caption = `Alert! ${events || files.length} human detection(s)${where} between ${timestamp} and ${last || timestamp}.`;
+
+        const telegramFormData = new FormData();
+        telegramFormData.append('chat_id', userId);
+        let endpoint: string;
+        if (files.length === 1) {
+            telegramFormData.append('caption', caption);
+            telegramFormData.append('photo', new Blob([await files[0].arrayBuffer()]), files[0].name);
+            endpoint = `https://api.telegram.org/bot${botToken}/sendPhoto`;
+        } else {
+            const media = files.map((file, i) => ({
+                type: 'photo',
+                media: `attach://photo${i}`,
+                ...(i === 0 ? { caption } : {}),
+            }));
+            telegramFormData.append('media', JSON.stringify(media));
+            for (const [i, file] of files.entries()) {
+                telegramFormData.append(`photo${i}`, new Blob([await file.arrayBuffer()]), file.name);
+            }
+            endpoint = `https://api.telegram.org/bot${botToken}/sendMediaGroup`;
+        }
+
+        const response = await fetch(endpoint, {
+            method: 'POST',
+            body: telegramFormData,
+        });
+
+        const result = await response.json();
+
+        if (response.ok) {
+            return NextResponse.json({
+                status: 'Images Sent',
+                telegram_response: result,
+            });
+        } else {
+            return NextResponse.json(
+                {
+                    status: 'Failed to send images',
+                    telegram_response: result,
+                },
+                { status: 500 }
+            );
+        }
+    } catch (error) {
+        console.error('Error processing request:', error);
+        return NextResponse.json({ error: 'Internal server error' }, { status: 500 });
+    }
+}
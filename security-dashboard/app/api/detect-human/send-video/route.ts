@@ -1,5 +1,6 @@
 // app/api/detect-human/send-video/route.ts
 import { NextRequest, NextResponse } from 'next/server';
+import { rateLimited, takeAlertToken } from '@/lib/rate-limit';
 import { writeFile, unlink } from 'fs/promises';
 import path from 'path';
 import { mkdir } from 'fs/promises';
@@ -29,6 +30,11 @@ export async function POST(request: NextRequest) {
             return NextResponse.json({ error: 'Missing user_id parameter' }, { status: 400 });
         }
 
+        const wait = takeAlertToken(userId);
+        if (wait > 0) {
+            return rateLimited(wait);
+        }
+
         // Create file path
         const bytes = await file.arrayBuffer();
         const buffer = Buffer.from(bytes);
@@ -0,0 +1,38 @@
+import { NextResponse } from 'next/server';
+
+// Per-chat alert rate limit shared by every /api/detect-human route.
+// Each camera process only paces itself, so this is what caps a chat at
+// ALERT_RATE messages a minute (bursts of ALERT_BURST) across all cameras.
+const ALERT_RATE = Number(process.env.ALERT_RATE ?? '6') / 60; // Messages per second; 0 = unlimited
+const ALERT_BURST = Math.max(1, Number(process.env.ALERT_BURST ?? '3'));
+
+type Bucket = { tokens: number; updated: number };
+
+// Kept on globalThis so every route bundle, and dev reloads, share the buckets
+const globalBuckets = globalThis as unknown as { alertBuckets?: Map<string, Bucket> };
+const buckets = (globalBuckets.alertBuckets ??= new Map<string, Bucket>());
+
+/** Take one message for `chatId`; returns 0 on success, else seconds until one is available. */
+export function takeAlertToken(chatId: string): number {
+    if (ALERT_RATE <= 0) {
+        return 0;
+    }
+    const now = Date.now() / 1000;
+    const bucket = buckets.get(chatId) ?? { tokens: ALERT_BURST, updated: now };
+    bucket.tokens = Math.min(ALERT_BURST, bucket.tokens + (now - bucket.updated) * ALERT_RATE);
+    bucket.updated = now;
+    buckets.set(chatId, bucket);
+    if (bucket.tokens < 1) {
+        return (1 - bucket.tokens) / ALERT_RATE;
+    }
+    bucket.tokens -= 1;
+    return 0;
+}
+
+/** The 429 the camera's outbox retries after. */
+export function rateLimited(wait: number) {
+    return NextResponse.json(
+        { error: 'Alert rate limit reached for this chat' },
+        { status: 429, headers: { 'Retry-After': String(Math.ceil(wait)) } }
+    );
+}
@@ -0,0 +1,300 @@
+import asyncio
+import json
+import math
+import os
+from aiohttp import ClientError, ClientSession, ClientTimeout, FormData, TCPConnector, web
+from dotenv import load_dotenv
+from rate_limit import ChatRateLimit
+from streaming import CHUNK_SIZE, MultipartStream, spooled_file
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Point at server/fake_telegram.py for load tests
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+MAX_INFLIGHT_PER_CHAT = int(os.getenv("MAX_INFLIGHT_PER_CHAT", "2"))
+MAX_QUEUED_PER_CHAT = int(os.getenv("MAX_QUEUED_PER_CHAT", "8"))
+MAX_INFLIGHT_TOTAL = int(os.getenv("MAX_INFLIGHT_TOTAL", "64"))
+TELEGRAM_TIMEOUT = ClientTimeout(total=120, connect=10)
+RETRY_AFTER = "5"  # Seconds clients should wait after a 429/503
+MAX_ALBUM = 10  # Telegram accepts 2-10 photos per media group
+
+
+class ChatLimiter:
+    """Bounds concurrent Telegram uploads for one chat."""
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(MAX_INFLIGHT_PER_CHAT)
+        self.waiting = 0  # Requests holding or queued for the semaphore
+
+
+def full(limiter):
+    return limiter.waiting >= MAX_INFLIGHT_PER_CHAT + MAX_QUEUED_PER_CHAT
+
+
+def busy(status, message, retry_after=RETRY_AFTER):
+    return web.json_response(
+        {"error": message}, status=status, headers={"Retry-After": str(retry_after)}
+    )
+
+
+def rate_limited(wait):
+    # The camera's outbox keeps the upload and retries after Retry-After
+    return busy(429, "Alert rate limit reached for this chat", math.ceil(wait))
+
+
+async def counted(request, handler, *args):
+    """Run `handler` holding one of the MAX_INFLIGHT_TOTAL slots.
+
+    The slot is taken before the upload is read, so a burst of uploads that
+    are still being spooled already counts against the limit.
+    """
+    app = request.app
+    if app["inflight"] >= MAX_INFLIGHT_TOTAL:
+        return busy(503, "Server busy, try again later")
+    app["inflight"] += 1
+    try:
+        return await handler(request, *args)
+    finally:
+        app["inflight"] -= 1
+
+
+async def relay(request, kind):
+    """Forward an uploaded image or video to Telegram for the given chat."""
+    app = request.app
+
+    # Read the form part by part; the file goes into a spooled buffer in
+    # chunks instead of being parsed into memory or saved under its filename
+    fields = {}
+    file = None
+    reader = await request.multipart()
+    async for part in reader:
+        if part.filename is None:
+            fields[part.name] = await part.text()
+            continue
+        if part.name != "file" or file is not None:
+            continue
+        # Clients send the form fields first, so the chat is known by now
+        user_id = fields.get("user_id")
+        if user_id and user_id in app["chats"] and full(app["chats"][user_id]):
+            return busy(429, "Too many uploads for this chat")
+        wait = app["rate_limit"].wait_time(user_id) if user_id else 0
+        if wait > 0:
+            return rate_limited(wait)
+        file = (spooled_file(), part.filename, part.headers.get("Content-Type"))
+        while True:
+            chunk = await part.read_chunk(CHUNK_SIZE)
+            if not chunk:
+                break
+            file[0].write(chunk)
+
+    if file is None:
+        return web.json_response({"error": f"No {kind} file uploaded"}, status=400)
+
+    user_id = fields.get("user_id")
+    timestamp = fields.get("timestamp")
+    if not user_id:
+        file[0].close()
+        return web.json_response({"error": "Missing user_id parameter"}, status=400)
+
+    limiter = app["chats"].setdefault(user_id, ChatLimiter())
+    if full(limiter):
+        file[0].close()
+        return busy(429, "Too many uploads for this chat")
+    wait = app["rate_limit"].take(user_id)
+    if wait > 0:
+        file[0].close()
+        return rate_limited(wait)
+
+    if kind == "video":
+        method, field, message = "sendVideo", "video", "Here is the video."
+    else:
+        method, field, message = "sendPhoto", "photo", f"Alert! Human detected at {timestamp}."
+
+    spool, filename, content_type = file
+    body = MultipartStream(
+        {"chat_id": user_id, "caption": message}, field, filename, content_type, spool
+    )
+
+    async def chunks():
+        # A large spool lives on disk; read it off the event loop
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, body.read, CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    limiter.waiting += 1
+    try:
+        async with limiter.semaphore:
+            async with app["session"].post(
+                f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}/{method}",
+                data=chunks(),
+                headers={"Content-Type": body.content_type, "Content-Length": str(len(body))},
+            ) as response:
+                status = response.status
+                text = await response.text()
+                payload = await response.json(content_type=None) if status == 200 else None
+    except (ClientError, asyncio.TimeoutError) as e:
+        return web.json_response(
+            {"status": f"Failed to send {kind}", "telegram_response": str(e)}, status=502
+        )
+    finally:
+        spool.close()
+        limiter.waiting -= 1
+        if limiter.waiting == 0:
+            app["chats"].pop(user_id, None)
+
+    if status == 200:
+        label = "Video Sent" if kind == "video" else "Image Sent"
+        return web.json_response({"status": label, "telegram_response": payload})
+    return web.json_response(
+        {"status": f"Failed to send {kind}", "telegram_response": text}, status=500
+    )
+
+
+async def relay_album(request):
+    """Forward a batch of snapshots to Telegram as one captioned album."""
+    app = request.app
+    fields = {}
+    files = []
+    reader = await request.multipart()
+    async for part in reader:
+        if part.filename is None:
+            fields[part.name] = await part.text()
+            continue
+        if part.name != "file" or len(files) >= MAX_ALBUM:
+            continue
+        user_id = fields.get("user_id")
+        if user_id and user_id in app["chats"] and full(app["chats"][user_id]):
+            for spool, _, _ in files:
+                spool.close()
+            return busy(429, "Too many uploads for this chat")
+        wait = app["rate_limit"].wait_time(user_id) if user_id else 0
+        if wait > 0:
+            for spool, _, _ in files:
+                spool.close()
+            return rate_limited(wait)
+        # Snapshots are small; each is still spooled rather than kept as bytes
+        spool = spooled_file()
+        while True:
+            chunk = await part.read_chunk(CHUNK_SIZE)
+            if not chunk:
+                break
+            spool.write(chunk)
+        spool.seek(0)
+        files.append((spool, part.filename, part.headers.get("Content-Type")))
+
+    user_id = fields.get("user_id")
+    if not files or not user_id:
+        for spool, _, _ in files:
+            spool.close()
+        error = "No image files uploaded" if not files else "Missing user_id parameter"
+        return web.json_response({"error": error}, status=400)
+
+    limiter = app["chats"].setdefault(user_id, ChatLimiter())
+    if full(limiter):
+        for spool, _, _ in files:
+            spool.close()
+        return busy(429, "Too many uploads for this chat")
+    wait = app["rate_limit"].take(user_id)
+    if wait > 0:
+        for spool, _, _ in files:
+            spool.close()
+        return rate_limited(wait)
+
+    timestamp = fields.get("timestamp")
+    camera = fields.get("camera")
+    where = f" on {camera}" if camera and camera != "default" else ""
+    caption = (
+        f"Alert! {fields.get('events') or len(files)} human detection(s){where} "
+        f"between {timestamp} and {fields.get('last') or timestamp}."
+    )
+    form = FormData()
+    form.add_field("chat_id", user_id)
+    if len(files) == 1:
+        method = "sendPhoto"
+        form.add_field("caption", caption)
+        spool, filename, content_type = files[0]
+        form.add_field("photo", spool, filename=filename, content_type=content_type or "image/jpeg")
+    else:
+        method = "sendMediaGroup"
+        media = [
+            dict({"type": "photo", "media": f"attach://photo{i}"}, **({"caption": caption} if i == 0 else {}))
+            for i in range(len(files))
+        ]
+        form.add_field("media", json.dumps(media))
+        for i, (spool, filename, content_type) in enumerate(files):
+            form.add_field(f"photo{i}", spool, filename=filename, content_type=content_type or "image/jpeg")
+
+    limiter.waiting += 1
+    try:
+        async with limiter.semaphore:
+            async with app["session"].post(
+                f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}/{method}", data=form
+            ) as response:
+                status = response.status
+                text = await response.text()
+                payload = await response.json(content_type=None) if status == 200 else None
+    except (ClientError, asyncio.TimeoutError) as e:
+        return web.json_response(
+            {"status": "Failed to send images", "telegram_response": str(e)}, status=502
+        )
+    finally:
+        for spool, _, _ in files:
+            spool.close()
+        limiter.waiting -= 1
+        if limiter.waiting == 0:
+            app["chats"].pop(user_id, None)
+
+    if status == 200:
+        return web.json_response({"status": "Images Sent", "telegram_response": payload})
+    return web.json_response(
+        {"status": "Failed to send images", "telegram_response": text}, status=500
+    )
+
+
+async def home(request):
+    return web.Response(text="Server is running")
+
+
+async def detect_human(request):
+    return await counted(request, relay, "video")
+
+
+async def detect_human_image(request):
+    return await counted(request, relay, "image")
+
+
+async def detect_human_images(request):
+    return await counted(request, relay_album)
+
+
+async def start_session(app):
+    # One pooled keep-alive client for every Telegram call
+    app["session"] = ClientSession(
+        connector=TCPConnector(limit=MAX_INFLIGHT_TOTAL), timeout=TELEGRAM_TIMEOUT
+    )
+
+
+async def close_session(app):
+    await app["session"].close()
+
+
+def create_app():
+    app = web.Application(client_max_size=1024 ** 3)
+    app["inflight"] = 0
+    app["chats"] = {}
+    app["rate_limit"] = ChatRateLimit()
+    app.on_startup.append(start_session)
+    app.on_cleanup.append(close_session)
+    app.router.add_get("/", home)
+    app.router.add_post("/detect-human-video", detect_human)
+    app.router.add_post("/detect-human-image", detect_human_image)
+    app.router.add_post("/detect-human-images", detect_human_images)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host="localhost", port=5000)
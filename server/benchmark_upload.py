@@ -0,0 +1,107 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+from streaming import MultipartStream
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVERS = {"flask": "server.py", "async": "async_server.py"}
+FAKE_PORT = 8081
+
+
+def peak_rss_mb(pid):
+    """Peak resident memory of a process (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+def wait_for(url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.2)
+    return False
+
+
+def make_clip(size_mb):
+    """Create a throwaway file the size of a large AVI clip."""
+    clip = tempfile.NamedTemporaryFile(suffix=".avi", delete=False)
+    chunk = os.urandom(1024 * 1024)
+    for _ in range(size_mb):
+        clip.write(chunk)
+    clip.close()
+    return clip.name
+
+
+def upload(url, path):
+    with open(path, "rb") as f:
+        body = MultipartStream(
+            {"user_id": "benchmark", "timestamp": str(time.time())},
+            "file",
+            os.path.basename(path),
+            "video/x-msvideo",
+            f,
+        )
+        start = time.perf_counter()
+        response = requests.post(url, data=body, headers={"Content-Type": body.content_type})
+        return response.status_code, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload throughput and peak server memory for large clips")
+    parser.add_argument("--server", choices=list(SERVERS), default="flask")
+    parser.add_argument("--sizes-mb", default="10,50,200")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        TELEGRAM_API_URL=f"http://localhost:{FAKE_PORT}",
+        FAKE_TELEGRAM_DELAY="0",
+        FAKE_TELEGRAM_PORT=str(FAKE_PORT),
+        BOT_TOKEN="benchmark",
+    )
+    fake = subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, "fake_telegram.py")], env=env)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(SERVER_DIR, SERVERS[args.server])],
+        env=env,
+        cwd=os.path.dirname(SERVER_DIR),
+    )
+    try:
+        if not wait_for("http://localhost:5000/") or not wait_for(f"http://localhost:{FAKE_PORT}/"):
+            print("Servers did not start")
+            return
+        url = "http://localhost:5000/detect-human-video"
+        print(f"{'size MB':>8}{'status':>8}{'MB/s':>10}{'peak RSS MB':>14}")
+        for size_mb in (int(s) for s in args.sizes_mb.split(",")):
+            path = make_clip(size_mb)
+            try:
+                for _ in range(args.repeat):
+                    status, elapsed = upload(url, path)
+                    print(
+                        f"{size_mb:>8}{status:>8}{size_mb / elapsed:>10.1f}"
+                        f"{peak_rss_mb(server.pid):>14.1f}"
+                    )
+            finally:
+                os.remove(path)
+    finally:
+        server.terminate()
+        fake.terminate()
+        server.wait()
+        fake.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import asyncio
+import os
+import time
+from aiohttp import web
+
+# Local stand-in for the Telegram Bot API, for load tests:
+#   TELEGRAM_API_URL=http://localhost:8081 python server/async_server.py
+FAKE_DELAY = float(os.getenv("FAKE_TELEGRAM_DELAY", "0.5"))  # Seconds per upload
+FAKE_PORT = int(os.getenv("FAKE_TELEGRAM_PORT", "8081"))
+
+
+async def send_media(request):
+    received = 0
+    reader = await request.multipart()
+    chat_id = None
+    async for part in reader:
+        if part.name == "chat_id":
+            chat_id = await part.text()
+            continue
+        while True:
+            chunk = await part.read_chunk()
+            if not chunk:
+                break
+            received += len(chunk)
+    await asyncio.sleep(FAKE_DELAY)
+    return web.json_response(
+        {
+            "ok": True,
+            "result": {
+                "chat": {"id": chat_id},
+                "date": int(time.time()),
+                "bytes": received,
+                "method": request.match_info["method"],
+            },
+        }
+    )
+
+
+def create_app():
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_post("/bot{token}/{method}", send_media)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host="localhost", port=FAKE_PORT)
@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+from aiohttp import ClientSession, FormData
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def send(session, url, kind, payload, chat_id, results):
+    data = FormData()
+    data.add_field("user_id", chat_id)
+    data.add_field("timestamp", str(time.time()))
+    filename = "load_test.avi" if kind == "video" else "load_test.jpg"
+    mime = "video/x-msvideo" if kind == "video" else "image/jpeg"
+    data.add_field("file", payload, filename=filename, content_type=mime)
+    start = time.perf_counter()
+    try:
+        async with session.post(url, data=data) as response:
+            await response.read()
+            status = response.status
+    except Exception as e:
+        status = type(e).__name__
+    results.append((status, time.perf_counter() - start))
+
+
+async def run(args):
+    payload = os.urandom(args.size_kb * 1024)
+    path = "/detect-human-video" if args.kind == "video" else "/detect-human-image"
+    url = args.server.rstrip("/") + path
+    results = []
+    start = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(
+            *(
+                send(session, url, args.kind, payload, f"chat{i % args.chats}", results)
+                for i in range(args.requests)
+            )
+        )
+    elapsed = time.perf_counter() - start
+
+    statuses = Counter(status for status, _ in results)
+    latencies = [latency for status, latency in results if status == 200]
+    print(f"{args.requests} requests to {url} in {elapsed:.2f} s ({args.requests / elapsed:.1f} req/s)")
+    print("Status codes:", dict(statuses))
+    print(
+        f"Latency (200s): p50 {percentile(latencies, 50) * 1000:.0f} ms, "
+        f"p90 {percentile(latencies, 90) * 1000:.0f} ms, "
+        f"p99 {percentile(latencies, 99) * 1000:.0f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Burst uploads at the relay server (run fake_telegram.py behind it)"
+    )
+    parser.add_argument("--server", default="http://localhost:5000")
+    parser.add_argument("--kind", choices=["image", "video"], default="video")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--chats", type=int, default=3)
+    parser.add_argument("--size-kb", type=int, default=2048)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Alert messages per minute and burst per chat, counted over every camera
+# process posting through this relay; 0 = unlimited
+ALERT_RATE = float(os.getenv("ALERT_RATE", "6"))
+ALERT_BURST = float(os.getenv("ALERT_BURST", "3"))
+
+
+class ChatRateLimit:
+    """One token bucket per chat, shared by every client of the relay."""
+
+    def __init__(self, rate=ALERT_RATE / 60, burst=ALERT_BURST):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.buckets = {}  # chat -> [tokens, updated]
+        self.lock = threading.Lock()
+
+    def _refill(self, chat, now):
+        bucket = self.buckets.setdefault(chat, [self.burst, now])
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        return bucket
+
+    def wait_time(self, chat):
+        """Seconds until `chat` may be sent another message."""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            tokens = self._refill(chat, time.monotonic())[0]
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, chat):
+        """Take a message for `chat`; returns 0 on success, else the wait."""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            bucket = self._refill(chat, time.monotonic())
+            if bucket[0] < 1:
+                return (1 - bucket[0]) / self.rate
+            bucket[0] -= 1
+        return 0.0
@@ -1,15 +1,36 @@
+import math
 import requests
-from flask import Flask, jsonify, request
+from flask import Flask, Request, jsonify, request
 import os
 from dotenv import load_dotenv
+from rate_limit import ChatRateLimit
+from streaming import MultipartStream, spooled_file
 
 load_dotenv()
 
+
+class SpoolingRequest(Request):
+    # Keep small uploads in memory and spill large ones to an anonymous temp
+    # file, instead of saving every upload under a shared filename
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return spooled_file()
+
+
 app = Flask(__name__)
+app.request_class = SpoolingRequest
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-UPLOAD_FOLDER = "server/uploads/"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+rate_limit = ChatRateLimit()
+
+
+def rate_limited(wait):
+    # The camera's outbox keeps the upload and retries after Retry-After
+    return (
+        jsonify({"error": "Alert rate limit reached for this chat"}),
+        429,
+        {"Retry-After": str(math.ceil(wait))},
+    )
 
 
 @app.route("/")
@@ -29,22 +50,27 @@ def detect_human():
     if not user_id:
         return jsonify({"error": "Missing user_id parameter"}), 400
 
-    CHAT_ID = user_id
-
-    temp_path = os.path.join(UPLOAD_FOLDER, file.filename)
-    file.save(temp_path)
-
-    with open(temp_path, "rb") as video_file:
-        message = f"Here is the video."
-        telegram_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendVideo"
+    wait = rate_limit.take(user_id)
+    if wait > 0:
+        return rate_limited(wait)
 
-        response = requests.post(
-            telegram_url,
-            data={"chat_id": CHAT_ID, "caption": message},
-            files={"video": video_file},
-        )
+    CHAT_ID = user_id
 
-    os.remove(temp_path)
+    message = f"Here is the video."
+    telegram_url = f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendVideo"
+
+    # Stream the upload to Telegram in chunks
+    body = MultipartStream(
+        {"chat_id": CHAT_ID, "caption": message},
+        "video",
+        file.filename,
+        file.mimetype,
+        file.stream,
+    )
+    response = requests.post(
+        telegram_url, data=body, headers={"Content-Type": body.content_type}
+    )
+    file.close()
 
     if response.status_code == 200:
         return (
@@ -72,22 +98,27 @@ def detect_human_image():
     if not user_id:
         return jsonify({"error": "Missing user_id parameter"}), 400
 
-    CHAT_ID = user_id
-
-    temp_path = os.path.join(UPLOAD_FOLDER, file.filename)
-    file.save(temp_path)
+    wait = rate_limit.take(user_id)
+    if wait > 0:
+        return rate_limited(wait)
 
-    with open(temp_path, "rb") as image_file:
-        message = f"Alert! Human detected at {timestamp}."
-        telegram_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto"
-
-        response = requests.post(
-            telegram_url,
-            data={"chat_id": CHAT_ID, "caption": message},
-            files={"photo": image_file},
-        )
+    CHAT_ID = user_id
 
-    os.remove(temp_path)
+    message = f"Alert! Human detected at {timestamp}."
+    telegram_url = f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendPhoto"
+
+    # Stream the upload to Telegram in chunks
+    body = MultipartStream(
+        {"chat_id": CHAT_ID, "caption": message},
+        "photo",
+        file.filename,
+        file.mimetype,
+        file.stream,
+    )
+    response = requests.post(
+        telegram_url, data=body, headers={"Content-Type": body.content_type}
+    )
+    file.close()
     if response.status_code == 200:
         return (
             jsonify({"status": "Image Sent", "telegram_response": response.json()}),
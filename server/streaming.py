@@ -0,0 +1,70 @@
+import io
+import os
+import tempfile
+import uuid
+
+# Uploads up to this size stay in memory; larger ones spill to a temp file
+SPOOL_THRESHOLD = int(os.getenv("SPOOL_THRESHOLD", str(8 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+
+def spooled_file():
+    """Anonymous upload buffer: memory below SPOOL_THRESHOLD, disk above."""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
+
+
+class MultipartStream:
+    """multipart/form-data body that reads the file part lazily, in chunks.
+
+    Works as a file-like `data=` for `requests` (which sends it with a
+    Content-Length from `len()`), and `iter_chunks()` feeds async clients.
+    Only one chunk of the file is ever held in memory.
+    """
+
+    def __init__(self, fields, file_field, filename, content_type, fileobj):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+
+        head = io.BytesIO()
+        for name, value in fields.items():
+            head.write(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                f"{value}\r\n".encode()
+            )
+        head.write(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+            f'filename="{os.path.basename(filename or file_field)}"\r\n'
+            f"Content-Type: {content_type or 'application/octet-stream'}\r\n\r\n".encode()
+        )
+        tail = f"\r\n--{boundary}--\r\n".encode()
+
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell()
+        fileobj.seek(0)
+
+        self.length = head.tell() + size + len(tail)
+        head.seek(0)
+        self.parts = [head, fileobj, io.BytesIO(tail)]
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(CHUNK_SIZE), b""))
+        while self.parts:
+            chunk = self.parts[0].read(size)
+            if chunk:
+                return chunk
+            self.parts.pop(0)
+        return b""
+
+    def __iter__(self):
+        return self.iter_chunks()
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
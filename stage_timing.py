@@ -0,0 +1,115 @@
+import atexit
+import json
+import metrics
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+# Every sample also feeds this process's /metrics histograms (see metrics.py).
+# Set by benchmark_pipelines.py: every process dumps its samples here as
+# stage_timing_<pid>.json
+STAGE_TIMING_DIR = os.getenv("STAGE_TIMING_DIR")
+MAX_SAMPLES = 20000  # Most recent samples kept per stage
+DUMP_INTERVAL = 5  # Seconds between dumps, in case the process is killed
+
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_counts = defaultdict(int)
+_counters = defaultdict(int)
+_started = time.time()
+
+
+def record(stage, seconds):
+    """Add one duration sample for `stage`."""
+    metrics.observe("stage", stage, seconds, "Duration of pipeline stages")
+    with _lock:
+        if STAGE_TIMING_DIR:
+            # Raw samples are only kept for benchmark runs
+            _samples[stage].append(seconds)
+        _counts[stage] += 1
+
+
+def count(name, n=1):
+    """Increment a plain counter, e.g. frames processed or dropped."""
+    metrics.inc(name, n)
+    with _lock:
+        _counters[name] += n
+
+
+class timed:
+    """Context manager that records the duration of its block for `stage`."""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+def summarize(samples):
+    """p50/p90/p99/mean/max in milliseconds for a list of seconds."""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p90_ms": percentile(ordered, 90) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "mean_ms": sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+        "max_ms": ordered[-1] * 1000 if ordered else 0.0,
+    }
+
+
+def snapshot(with_samples=False):
+    with _lock:
+        samples = {stage: list(_samples[stage]) for stage in _counts}
+        counts = dict(_counts)
+        counters = dict(_counters)
+    stages = {}
+    for stage, values in samples.items():
+        stages[stage] = dict(summarize(values), count=counts[stage])
+        if with_samples:
+            stages[stage]["samples"] = values
+    return {
+        "pid": os.getpid(),
+        "elapsed": time.time() - _started,
+        "stages": stages,
+        "counters": counters,
+    }
+
+
+def dump(directory=STAGE_TIMING_DIR):
+    """Write this process's samples to `directory` (atomically)."""
+    if not directory:
+        return
+    path = os.path.join(directory, f"stage_timing_{os.getpid()}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(snapshot(with_samples=True), f)
+    os.replace(path + ".tmp", path)
+
+
+def _dump_periodically():
+    while True:
+        time.sleep(DUMP_INTERVAL)
+        try:
+            dump()
+        except OSError:
+            pass
+
+
+if STAGE_TIMING_DIR:
+    atexit.register(dump)
+    threading.Thread(target=_dump_periodically, daemon=True).start()
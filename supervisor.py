@@ -0,0 +1,454 @@
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from dotenv import load_dotenv
+import frame_buffer
+import metrics
+import recording_catalog
+import retention
+
+load_dotenv()
+
+# Cameras come from CAMERAS_CONFIG (JSON, see README), else from CAMERA_URLS
+# ("name=url,..."), else VIDEO_URL as the single "default" camera
+CAMERAS_CONFIG = os.getenv("CAMERAS_CONFIG", "cameras.json")
+CAMERA_URLS = os.getenv("CAMERA_URLS", "")
+VIDEO_URL = os.getenv("VIDEO_URL")
+PIPELINES = os.getenv("PIPELINES", "continuous,human")  # Pipelines run per camera
+PIN_CORES = os.getenv("PIN_CORES", "0") == "1"  # Spread cameras over the cores
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "30"))  # Seconds without frames before a restart
+HEALTH_INTERVAL = 5  # Seconds between health checks and resource samples
+STARTUP_GRACE = 60  # Seconds a new process gets to connect and load its model
+RESTART_DELAY = 1  # First restart delay; doubles per crash up to MAX_RESTART_DELAY
+MAX_RESTART_DELAY = 60
+STABLE_SECONDS = 300  # A process that ran this long restarts without backoff
+STOP_TIMEOUT = 30  # Seconds a process gets to close its files before it is killed
+REPORT_INTERVAL = 60  # Seconds between per-camera resource reports
+CAMERA_PORT_STRIDE = 10  # Camera n's processes serve /metrics from METRICS_PORT + 10 * n
+DEFAULT_CAMERA = "default"  # Keeps the single-camera buffer, directories and ports
+CAMERA_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+# Each process is a fresh interpreter, so per-camera settings read from the
+# environment at import time apply
+WORKERS = {
+    "capture": "import sys, frame_buffer, metrics; "
+               "metrics.run_with_metrics('capture', frame_buffer.run_capture, sys.argv[1])",
+    "continuous": "import sys, continuous_recording, metrics; "
+                  "metrics.run_with_metrics('continuous', continuous_recording.continuous_recording, sys.argv[1])",
+    "human": "import sys, human_detection, metrics; "
+             "metrics.run_with_metrics('human', human_detection.run_human_detection, sys.argv[1])",
+    "motion": "import sys, motion_detection; motion_detection.main(sys.argv[1])",
+    "retention": "import sys, metrics, supervisor; "
+                 "metrics.run_with_metrics('retention', supervisor.run_retention, sys.argv[1])",
+}
+CAMERA_PIPELINES = ("continuous", "human", "motion")
+
+
+class Camera:
+    """A camera, its settings and its resource usage."""
+
+    def __init__(self, index, name, url, pipelines, env=None, cores=None):
+        self.index = index
+        self.name = name
+        self.url = str(url)
+        self.pipelines = pipelines
+        self.extra_env = {key: str(value) for key, value in (env or {}).items()}
+        self.cores = cores
+        self.workers = []
+        self.cpu_seconds = 0.0
+        self.cpu_percent = 0.0
+        self.rss = 0
+        self.frame_age = None
+
+    def environment(self):
+        """Environment of this camera's processes."""
+        env = {"CAMERA_NAME": self.name, "VIDEO_URL": self.url}
+        if self.name != DEFAULT_CAMERA:
+            video_root = os.path.join(retention.VIDEO_ROOT, self.name)
+            env.update(
+                FRAME_BUFFER_NAME=f"{frame_buffer.BUFFER_NAME}_{self.name}",
+                CONTINUOUS_DIR=os.path.join(video_root, "continuous"),
+                DETECTION_DIR=os.path.join(video_root, "detection"),
+                MOTION_DIR=os.path.join(video_root, "motion"),
+                DETECTION_IMAGE_DIR=os.path.join("images", self.name, "detection"),
+            )
+            if metrics.METRICS_PORT:
+                env["METRICS_PORT"] = str(metrics.METRICS_PORT + CAMERA_PORT_STRIDE * (self.index + 1))
+        if self.cores:
+            # Size thread pools to the pinned cores instead of the whole host
+            env["INFERENCE_THREADS"] = env["OMP_NUM_THREADS"] = str(len(self.cores))
+        env.update(self.extra_env)
+        return env
+
+    def dirs(self):
+        """Recording directories by kind, for the catalog."""
+        env = self.environment()
+        return {
+            kind: env.get(f"{kind.upper()}_DIR", directory)
+            for kind, directory in recording_catalog.VIDEO_DIRS.items()
+        }
+
+    @property
+    def restarts(self):
+        return sum(worker.restarts for worker in self.workers)
+
+
+def load_cameras(path=CAMERAS_CONFIG):
+    """Read the camera list; raises ValueError for an invalid configuration."""
+    config = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            config = json.load(f)
+        entries = config.get("cameras", [])
+    else:
+        entries = [{"name": name, "url": url} for name, url in frame_buffer.parse_sources(CAMERA_URLS)]
+        if not entries and VIDEO_URL:
+            entries = [{"name": DEFAULT_CAMERA, "url": VIDEO_URL}]
+
+    cameras = []
+    for i, entry in enumerate(entries):
+        name = entry.get("name") or f"camera{i}"
+        if not CAMERA_NAME_PATTERN.fullmatch(name):
+            raise ValueError(f"Invalid camera name '{name}': use letters, digits, '_' and '-'")
+        if any(camera.name == name for camera in cameras):
+            raise ValueError(f"Duplicate camera name '{name}'")
+        if "url" not in entry:
+            raise ValueError(f"Camera '{name}' has no url")
+        pipelines = entry.get("pipelines", config.get("pipelines", PIPELINES))
+        if isinstance(pipelines, str):
+            pipelines = [p.strip() for p in pipelines.split(",") if p.strip()]
+        unknown = set(pipelines) - set(CAMERA_PIPELINES)
+        if unknown:
+            raise ValueError(f"Camera '{name}': unknown pipelines {', '.join(sorted(unknown))}")
+        env = dict(config.get("env", {}), **entry.get("env", {}))
+        cameras.append(Camera(i, name, entry["url"], pipelines, env, entry.get("cores")))
+    return cameras
+
+
+def assign_cores(cameras):
+    """Give every camera without explicit `cores` its own block of cores."""
+    if not PIN_CORES or not cameras or not hasattr(os, "sched_getaffinity"):
+        return
+    cpus = sorted(os.sched_getaffinity(0))
+    per_camera = max(1, len(cpus) // len(cameras))
+    for i, camera in enumerate(cameras):
+        if camera.cores is None:
+            camera.cores = [cpus[(i * per_camera + j) % len(cpus)] for j in range(per_camera)]
+
+
+class Worker:
+    """One process of a camera, restarted with exponential backoff when it exits."""
+
+    def __init__(self, camera, kind, arg, env, cores=None, port=None, counts_frames=True):
+        self.camera = camera
+        self.kind = kind
+        self.arg = arg
+        self.env = env
+        self.cores = cores
+        self.port = port  # Its /metrics port, used to watch frame flow
+        self.counts_frames = counts_frames
+        # Pipelines close their recordings on SIGINT; capture unlinks its buffer on SIGTERM
+        self.stop_signal = signal.SIGINT if kind in CAMERA_PIPELINES else signal.SIGTERM
+        self.label = f"{camera}/{kind}" if camera else kind
+        self.process = None
+        self.started = 0.0
+        self.next_start = 0.0
+        self.kill_at = None
+        self.failures = 0
+        self.restarts = 0
+        self.frames = None
+        self.frames_changed = 0.0
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", WORKERS[self.kind], self.arg],
+            env=dict(os.environ, PYTHONUNBUFFERED="1", **self.env),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        if self.cores and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(self.process.pid, self.cores)
+            except OSError as e:
+                print(f"[{datetime.now()}] Supervisor: cannot pin {self.label} to cores {self.cores}: {e}")
+        threading.Thread(target=self._forward_output, args=(self.process,), daemon=True).start()
+        self.started = self.frames_changed = time.time()
+        self.frames = None
+        self.kill_at = None
+
+    def _forward_output(self, process):
+        # Prefix every line so the logs of dozens of processes stay readable
+        for line in process.stdout:
+            print(f"[{self.label}] {line.decode(errors='replace').rstrip()}", flush=True)
+
+    def stop(self, now):
+        """Ask the process to exit; it is killed if still running after STOP_TIMEOUT."""
+        if self.running() and self.kill_at is None:
+            self.process.send_signal(self.stop_signal)
+            self.kill_at = now + STOP_TIMEOUT
+
+    def reap(self, now):
+        """Kill the process if it overran its stop timeout; True while it runs."""
+        if not self.running():
+            return False
+        if self.kill_at is not None and now >= self.kill_at:
+            print(f"[{datetime.now()}] Supervisor: killing {self.label}")
+            self.process.kill()
+        return True
+
+    def supervise(self, now):
+        """Start the process when due, and schedule a restart once it has exited."""
+        if self.reap(now):
+            return
+        if self.process is not None:
+            code = self.process.returncode
+            self.process = None
+            if now - self.started >= STABLE_SECONDS:
+                self.failures = 0
+            delay = min(MAX_RESTART_DELAY, RESTART_DELAY * 2 ** self.failures)
+            self.failures += 1
+            self.restarts += 1
+            self.next_start = now + delay
+            metrics.inc("worker_restarts", help="Processes restarted by the supervisor")
+            print(f"[{datetime.now()}] Supervisor: {self.label} exited with code {code}, restarting in {delay:.0f} s")
+        if now >= self.next_start:
+            self.start()
+
+    def restart(self, now, reason):
+        print(f"[{datetime.now()}] Supervisor: restarting {self.label}: {reason}")
+        self.stop(now)
+
+    def frames_total(self):
+        """The process's frame counter read from its /metrics, or None if unreachable."""
+        try:
+            with urllib.request.urlopen(f"http://{metrics.METRICS_HOST}:{self.port}/metrics", timeout=1) as response:
+                text = response.read().decode()
+        except OSError:
+            return None
+        for line in text.splitlines():
+            if line.startswith("iot_frames_total{"):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+
+def build_workers(camera):
+    env = camera.environment()
+    port_base = int(env.get("METRICS_PORT", metrics.METRICS_PORT))
+    shared_url = frame_buffer.shared_source_url(env.get("FRAME_BUFFER_NAME", frame_buffer.BUFFER_NAME))
+    # Passthrough recording copies the camera's compressed stream itself
+    passthrough = env.get("RECORDING_MODE", os.getenv("RECORDING_MODE", "reencode")) == "passthrough"
+
+    def worker(kind, arg, counts_frames=True):
+        port = port_base + metrics.PROCESS_PORTS[kind] if port_base else None
+        return Worker(camera.name, kind, arg, env, camera.cores, port, counts_frames)
+
+    workers = []
+    if any(kind != "continuous" or not passthrough for kind in camera.pipelines):
+        workers.append(worker("capture", camera.url))
+    for kind in camera.pipelines:
+        if kind == "continuous" and passthrough:
+            workers.append(worker(kind, camera.url, counts_frames=False))
+        else:
+            workers.append(worker(kind, shared_url))
+    return workers
+
+
+def frame_age(camera):
+    """Seconds since the camera's capture process published a frame, or None."""
+    name = camera.environment().get("FRAME_BUFFER_NAME", frame_buffer.BUFFER_NAME)
+    try:
+        buffer = frame_buffer.FrameRingBuffer.attach(name, timeout=0)
+    except TimeoutError:
+        return None
+    try:
+        seq = buffer.write_seq
+        if seq < 0:
+            return None
+        return time.time() - float(buffer.slot_time[seq % buffer.slots])
+    finally:
+        buffer.close()
+
+
+def check_health(camera, now):
+    """Restart a capture process that stopped publishing and pipelines that stopped reading."""
+    capture = next((w for w in camera.workers if w.kind == "capture"), None)
+    if capture is None:
+        camera.frame_age = None
+    else:
+        camera.frame_age = frame_age(camera)
+        stalled = camera.frame_age is None or camera.frame_age > HEALTH_TIMEOUT
+        if stalled and capture.running() and now - capture.started > STARTUP_GRACE:
+            capture.restart(now, f"no frames for {HEALTH_TIMEOUT:g} s")
+            return
+    # Pipelines are only to blame when frames are coming in
+    flowing = capture is None or (camera.frame_age is not None and camera.frame_age < HEALTH_TIMEOUT)
+    for worker in camera.workers:
+        if worker is capture or not worker.port or not worker.counts_frames or not worker.running():
+            continue
+        total = worker.frames_total()
+        if total is None:
+            continue
+        if total != worker.frames:
+            worker.frames = total
+            worker.frames_changed = now
+        elif flowing and now - max(worker.frames_changed, worker.started + STARTUP_GRACE) > HEALTH_TIMEOUT:
+            worker.restart(now, f"no frames processed for {HEALTH_TIMEOUT:g} s")
+
+
+def process_table():
+    """{pid: (parent pid, CPU seconds, RSS bytes)} for every live process (Linux)."""
+    ticks = os.sysconf("SC_CLK_TCK")
+    page = os.sysconf("SC_PAGE_SIZE")
+    table = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        # Fields after the command name: state, ppid, ..., utime (11), stime (12), ..., rss (21)
+        table[int(entry)] = (int(fields[1]), (int(fields[11]) + int(fields[12])) / ticks, int(fields[21]) * page)
+    return table
+
+
+class ResourceAccounting:
+    """CPU and memory per camera, summed over its processes and their children."""
+
+    def __init__(self):
+        self.last_cpu = {}
+        self.last_time = None
+
+    def sample(self, cameras, now):
+        try:
+            table = process_table()
+        except OSError:
+            return
+        children = {}
+        for pid, (ppid, _, _) in table.items():
+            children.setdefault(ppid, []).append(pid)
+        elapsed = now - self.last_time if self.last_time else 0.0
+        self.last_time = now
+        last_cpu = {}
+        for camera in cameras:
+            pids = [w.process.pid for w in camera.workers if w.running()]
+            cpu_delta = 0.0
+            rss = 0
+            while pids:
+                pid = pids.pop()
+                if pid not in table:
+                    continue
+                pids.extend(children.get(pid, []))
+                _, cpu, size = table[pid]
+                cpu_delta += max(0.0, cpu - self.last_cpu.get(pid, 0.0))
+                last_cpu[pid] = cpu
+                rss += size
+            camera.cpu_seconds += cpu_delta
+            camera.cpu_percent = cpu_delta / elapsed * 100 if elapsed else 0.0
+            camera.rss = rss
+        self.last_cpu = last_cpu
+
+
+def register_gauges(camera):
+    labels = {"camera": camera.name}
+    metrics.gauge("camera_cpu_seconds", "CPU time used by a camera's processes", lambda: camera.cpu_seconds, labels)
+    metrics.gauge("camera_cpu_percent", "CPU use of a camera's processes", lambda: camera.cpu_percent, labels)
+    metrics.gauge("camera_rss_bytes", "Resident memory of a camera's processes", lambda: camera.rss, labels)
+    # Left out of the scrape while the camera has no frames
+    metrics.gauge("camera_frame_age_seconds", "Seconds since a camera's last captured frame", lambda: camera.frame_age, labels)
+    metrics.gauge("camera_restarts", "Process restarts of a camera", lambda: camera.restarts, labels)
+
+
+def format_report(camera):
+    age = "no frames" if camera.frame_age is None else f"last frame {camera.frame_age:.1f} s ago"
+    running = sum(w.running() for w in camera.workers)
+    return (
+        f"{camera.name}: {running}/{len(camera.workers)} processes, CPU {camera.cpu_percent:.0f}% "
+        f"({camera.cpu_seconds:.0f} s total), RSS {camera.rss / 1048576:.0f} MB, {age}, "
+        f"{camera.restarts} restarts"
+        + (f", cores {camera.cores}" if camera.cores else "")
+    )
+
+
+def run_retention(config=CAMERAS_CONFIG):
+    """Retention for every camera: adopt each camera's existing files, then enforce."""
+    for camera in load_cameras(config):
+        if camera.name == DEFAULT_CAMERA:
+            continue  # Its directories are retention's defaults
+        added = recording_catalog.rebuild(camera=camera.name, dirs=camera.dirs())
+        if added:
+            print(f"[{datetime.now()}] Retention: catalogued {added} existing recordings of {camera.name}")
+    retention.run_retention()
+
+
+def run_supervisor(config=CAMERAS_CONFIG):
+    """Run the pipelines of every configured camera until SIGINT/SIGTERM."""
+    try:
+        cameras = load_cameras(config)
+    except (OSError, ValueError) as e:
+        print(f"Invalid camera configuration: {e}")
+        return
+    if not cameras:
+        print("No cameras configured: set VIDEO_URL, CAMERA_URLS or CAMERAS_CONFIG")
+        return
+    assign_cores(cameras)
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    metrics.serve("supervisor")
+
+    # One retention process for all cameras; they share the recording catalog
+    shared = [Worker(None, "retention", config, {})]
+    for camera in cameras:
+        camera.workers = build_workers(camera)
+        register_gauges(camera)
+        print(f"[{datetime.now()}] Supervisor: {camera.name} runs {', '.join(w.kind for w in camera.workers)}")
+    workers = shared + [w for camera in cameras for w in camera.workers]
+
+    accounting = ResourceAccounting()
+    next_check = time.time() + HEALTH_INTERVAL
+    next_report = time.time() + REPORT_INTERVAL
+    try:
+        while not stop.is_set():
+            now = time.time()
+            for worker in workers:
+                worker.supervise(now)
+            if now >= next_check:
+                next_check = now + HEALTH_INTERVAL
+                accounting.sample(cameras, now)
+                for camera in cameras:
+                    check_health(camera, now)
+            if now >= next_report:
+                next_report = now + REPORT_INTERVAL
+                for camera in cameras:
+                    print(f"[{datetime.now()}] Supervisor: {format_report(camera)}")
+            stop.wait(0.5)
+    finally:
+        # Pipelines first so they finish their recordings while frames still flow
+        print(f"[{datetime.now()}] Supervisor: stopping")
+        for group in (
+            [w for w in workers if w.kind in CAMERA_PIPELINES],
+            [w for w in workers if w.kind not in CAMERA_PIPELINES],
+        ):
+            now = time.time()
+            for worker in group:
+                worker.stop(now)
+            # reap() every worker on each pass so overdue ones are all killed
+            while [worker for worker in group if worker.reap(time.time())]:
+                time.sleep(0.2)
+
+
+if __name__ == "__main__":
+    run_supervisor()
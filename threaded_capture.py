@@ -0,0 +1,143 @@
+import threading
+import stage_timing
+import time
+from datetime import datetime
+from frame_buffer import open_capture
+
+READ_TIMEOUT = 10  # Seconds read() waits for a new frame
+REPORT_INTERVAL = 30  # Seconds between latency reports
+
+
+class LatestFrameCapture:
+    """Read frames on a background thread and keep only the newest one.
+
+    The processing loop always gets the most recent frame instead of working
+    through OpenCV's internal backlog. Frames that were replaced before the
+    loop picked them up are counted as skipped, and `mark_decision()` records
+    how long each frame took from capture to the loop's decision.
+    """
+
+    def __init__(self, source, timeout=READ_TIMEOUT):
+        self.source = source
+        self.timeout = timeout
+        self.cap = open_capture(source)
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_time = None
+        self.frame_seq = -1
+        self.returned_seq = -1
+        self.read_time = None
+        # Seconds the last underlying read() blocked: mostly waiting for the
+        # camera's next frame, so it is not a measure of decode cost
+        self.read_wait = None
+        self.stopped = False
+        self.failed = False
+
+        # Stats
+        self.frames_captured = 0
+        self.frames_returned = 0
+        self.skipped = 0
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.last_report = time.time()
+
+        self.thread = None
+        if self.cap.isOpened():
+            self.thread = threading.Thread(target=self._reader, daemon=True)
+            self.thread.start()
+
+    def _reader(self):
+        while not self.stopped:
+            start = time.time()
+            ret, frame = self.cap.read()
+            self.read_wait = time.time() - start
+            stage_timing.record("read_wait", self.read_wait)
+            # Shared-memory sources know when the camera frame was decoded
+            captured_at = getattr(self.cap, "last_timestamp", None) or time.time()
+            with self.condition:
+                if not ret:
+                    self.failed = True
+                    self.condition.notify_all()
+                    return
+                self.frame = frame
+                self.frame_time = captured_at
+                self.frame_seq += 1
+                self.frames_captured += 1
+                self.condition.notify_all()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def read(self, timeout=None):
+        """Return (True, newest_frame), or (False, None) if none arrived in time.
+
+        `timeout=0` polls without waiting; check `failed` to tell a dead stream
+        from a frame that simply has not arrived yet.
+        """
+        with self.condition:
+            ready = self.condition.wait_for(
+                lambda: self.frame_seq > self.returned_seq or self.failed or self.stopped,
+                timeout=self.timeout if timeout is None else timeout,
+            )
+            if not ready or self.frame_seq <= self.returned_seq:
+                return False, None
+            # Every frame published since the last read() but not returned was skipped
+            stage_timing.count("skipped", self.frame_seq - self.returned_seq - 1)
+            self.skipped += self.frame_seq - self.returned_seq - 1
+            self.returned_seq = self.frame_seq
+            self.frames_returned += 1
+            self.read_time = self.frame_time
+            return True, self.frame
+
+    def mark_decision(self, captured_at=None):
+        """Record capture-to-decision latency of a frame and return it.
+
+        Defaults to the last frame returned by `read()`; pass the frame's
+        `read_time` when decisions lag behind reads.
+        """
+        captured_at = captured_at or self.read_time
+        if captured_at is None:
+            return None
+        latency = time.time() - captured_at
+        stage_timing.record("latency", latency)
+        stage_timing.count("frames")
+        self.latency_count += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        return latency
+
+    def stats(self):
+        avg = self.latency_total / self.latency_count if self.latency_count else 0.0
+        return {
+            "captured": self.frames_captured,
+            "processed": self.frames_returned,
+            "skipped": self.skipped,
+            "avg_latency_ms": avg * 1000,
+            "max_latency_ms": self.latency_max * 1000,
+        }
+
+    def report_due(self, interval=REPORT_INTERVAL):
+        """Return a printable stats line every `interval` seconds, else None."""
+        now = time.time()
+        if now - self.last_report < interval:
+            return None
+        self.last_report = now
+        stats = self.stats()
+        self.latency_max = 0.0  # Max is per reporting window
+        return (
+            f"[{datetime.now()}] Capture: {stats['processed']}/{stats['captured']} frames processed, "
+            f"{stats['skipped']} skipped, latency avg {stats['avg_latency_ms']:.1f} ms, "
+            f"max {stats['max_latency_ms']:.1f} ms"
+        )
+
+    def release(self):
+        self.stopped = True
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=self.timeout)
+        self.cap.release()
@@ -0,0 +1,111 @@
+import time
+
+IOU_THRESHOLD = 0.3  # Minimum overlap to match a detection to a track
+MAX_CENTROID_DISTANCE = 0.5  # Fallback match distance, as a fraction of track size
+MAX_MISSED = 3  # Detector runs a track may go unmatched before it ends
+
+
+def iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes."""
+    ix = min(a[2], b[2]) - max(a[0], b[0])
+    iy = min(a[3], b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def centroid_distance(a, b):
+    """Distance between box centres relative to the size of box `a`."""
+    ax, ay = (a[0] + a[2]) / 2, (a[1] + a[3]) / 2
+    bx, by = (b[0] + b[2]) / 2, (b[1] + b[3]) / 2
+    size = max(a[2] - a[0], a[3] - a[1], 1)
+    return ((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5 / size
+
+
+class Track:
+    def __init__(self, track_id, box, confidence, now):
+        self.id = track_id
+        self.box = box
+        self.confidence = confidence
+        self.first_seen = now
+        self.last_seen = now
+        self.missed = 0
+        self.hits = 1
+
+    @property
+    def dwell(self):
+        """Seconds between the first and the latest detection of this track."""
+        return self.last_seen - self.first_seen
+
+
+class PersonTracker:
+    """Carry person boxes between detector runs and give them stable IDs.
+
+    `update()` is called with the detections of every detector run; frames in
+    between simply keep the current `tracks`. Detections are matched to
+    tracks greedily by IoU, falling back to centroid distance for people
+    moving quickly between strided runs.
+    """
+
+    def __init__(self, iou_threshold=IOU_THRESHOLD, max_missed=MAX_MISSED):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = []
+        self.next_id = 1
+
+    def update(self, people, now=None):
+        """Match (confidence, box) detections; return (new_tracks, ended_tracks)."""
+        now = now or time.time()
+        boxes = [tuple(int(v) for v in box) for _, box in people]
+
+        pairs = []
+        for ti, track in enumerate(self.tracks):
+            for di, box in enumerate(boxes):
+                overlap = iou(track.box, box)
+                if overlap >= self.iou_threshold:
+                    pairs.append((1.0 + overlap, ti, di))
+                else:
+                    distance = centroid_distance(track.box, box)
+                    if distance <= MAX_CENTROID_DISTANCE:
+                        pairs.append((1.0 - distance, ti, di))
+        pairs.sort(reverse=True)
+
+        matched_tracks, matched_dets = set(), set()
+        for _, ti, di in pairs:
+            if ti in matched_tracks or di in matched_dets:
+                continue
+            matched_tracks.add(ti)
+            matched_dets.add(di)
+            track = self.tracks[ti]
+            track.box = boxes[di]
+            track.confidence = people[di][0]
+            track.last_seen = now
+            track.missed = 0
+            track.hits += 1
+
+        ended = []
+        alive = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    ended.append(track)
+                    continue
+            alive.append(track)
+
+        new = []
+        for di, box in enumerate(boxes):
+            if di not in matched_dets:
+                track = Track(self.next_id, box, people[di][0], now)
+                self.next_id += 1
+                new.append(track)
+                alive.append(track)
+
+        self.tracks = alive
+        return new, ended
+
+    def people(self):
+        """Current tracks as (confidence, box) pairs."""
+        return [(track.confidence, track.box) for track in self.tracks]
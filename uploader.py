@@ -0,0 +1,252 @@
+import heapq
+import json
+from contextlib import ExitStack
+import metrics
+import os
+import stage_timing
+import threading
+import time
+import uuid
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "outbox")
+# Each camera process keeps its own outbox so they never resend each other's jobs
+OUTBOX_NAME = os.getenv("CAMERA_NAME", "default")
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+UPLOAD_TIMEOUT = (5, 120)  # (connect, read) seconds
+RETRY_BASE_DELAY = 2  # Seconds before the first retry, doubled each attempt
+RETRY_MAX_DELAY = 300
+OUTBOX_MAX_AGE = 24 * 3600  # Give up on alerts older than this
+
+
+class UploadJob:
+    """One pending upload, persisted as a JSON file in the outbox.
+
+    `file_path` is a path, or a list of paths sent as several "file" parts.
+    """
+
+    def __init__(self, url, file_path, mime, data, job_id=None, created=None, attempts=0, next_attempt=0.0):
+        self.id = job_id or f"{time.time():.6f}_{uuid.uuid4().hex[:8]}"
+        self.url = url
+        self.file_path = file_path
+        self.mime = mime
+        self.data = data
+        self.created = created or time.time()
+        self.attempts = attempts
+        self.next_attempt = next_attempt
+
+    def __lt__(self, other):
+        return (self.next_attempt, self.id) < (other.next_attempt, other.id)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "url": self.url,
+            "file_path": self.file_path,
+            "mime": self.mime,
+            "data": self.data,
+            "created": self.created,
+            "attempts": self.attempts,
+            "next_attempt": self.next_attempt,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            d["url"], d["file_path"], d["mime"], d["data"], d["id"], d["created"],
+            d.get("attempts", 0), d.get("next_attempt", 0.0),
+        )
+
+
+class AlertUploader:
+    """Send alert uploads from a worker pool, retrying through a disk outbox.
+
+    `enqueue()` only writes a small JSON job file and wakes a worker, so the
+    detection loop never waits on the network. Workers share one keep-alive
+    `requests.Session`, retry failures with exponential backoff, and delete
+    the job file once the server accepted it. Jobs still in the outbox are
+    picked up again on the next start.
+    """
+
+    def __init__(self, outbox_dir=OUTBOX_DIR, workers=UPLOAD_WORKERS):
+        self.outbox_dir = outbox_dir
+        os.makedirs(outbox_dir, exist_ok=True)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.condition = threading.Condition()
+        self.jobs = []  # Heap ordered by next_attempt
+        self.running = True
+
+        # Stats
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+        self._load_outbox()
+        self.threads = [
+            threading.Thread(target=self._worker, daemon=True) for _ in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _job_path(self, job):
+        return os.path.join(self.outbox_dir, f"{job.id}.json")
+
+    def _save(self, job):
+        path = self._job_path(job)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job.to_dict(), f)
+        os.replace(tmp_path, path)  # Atomic, so a crash never leaves half a job
+
+    def _remove(self, job):
+        try:
+            os.remove(self._job_path(job))
+        except FileNotFoundError:
+            pass
+
+    def _load_outbox(self):
+        for filename in sorted(os.listdir(self.outbox_dir)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.outbox_dir, filename)) as f:
+                    job = UploadJob.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skipping unreadable outbox entry {filename}: {e}")
+                continue
+            heapq.heappush(self.jobs, job)
+        if self.jobs:
+            print(f"Resuming {len(self.jobs)} pending upload(s) from {self.outbox_dir}")
+
+    def enqueue(self, url, file_path, mime, data, delay=0.0):
+        """Persist an upload job and hand it to the workers, `delay` seconds from now."""
+        job = UploadJob(url, file_path, mime, data, next_attempt=time.time() + delay if delay else 0.0)
+        self._save(job)
+        with self.condition:
+            heapq.heappush(self.jobs, job)
+            self.condition.notify()
+        return job.id
+
+    def pending(self):
+        with self.condition:
+            return len(self.jobs)
+
+    def _next_job(self):
+        with self.condition:
+            while self.running:
+                if self.jobs:
+                    delay = self.jobs[0].next_attempt - time.time()
+                    if delay <= 0:
+                        return heapq.heappop(self.jobs)
+                    self.condition.wait(timeout=delay)
+                else:
+                    self.condition.wait()
+            return None
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._process(job)
+
+    def _process(self, job):
+        if time.time() - job.created > OUTBOX_MAX_AGE:
+            print(f"[{datetime.now()}] Dropping upload older than {OUTBOX_MAX_AGE // 3600} h: {job.file_path}")
+            stage_timing.count("uploads_failed")
+            self.failed += 1
+            self._remove(job)
+            return
+        paths = job.file_path if isinstance(job.file_path, list) else [job.file_path]
+        paths = [path for path in paths if os.path.exists(path)]
+        if not paths:
+            print(f"[{datetime.now()}] Dropping upload, file is gone: {job.file_path}")
+            stage_timing.count("uploads_failed")
+            self.failed += 1
+            self._remove(job)
+            return
+
+        try:
+            with ExitStack() as stack:
+                files = [
+                    ("file", (os.path.basename(path), stack.enter_context(open(path, "rb")), job.mime))
+                    for path in paths
+                ]
+                response = self.session.post(
+                    job.url, files=files, data=job.data, timeout=UPLOAD_TIMEOUT
+                )
+            if response.ok:
+                print(f"Server Response: {response.text}")
+                # Alert latency: from the recorder's enqueue to the server's answer
+                stage_timing.record("notify", time.time() - job.created)
+                stage_timing.count("uploads_sent")
+                stage_timing.count("upload_bytes", sum(os.path.getsize(path) for path in paths))
+                self.sent += 1
+                self._remove(job)
+                return
+            if 400 <= response.status_code < 500 and response.status_code != 429:
+                # The server rejected the request itself; retrying will not help
+                print(f"[{datetime.now()}] Upload rejected ({response.status_code}): {response.text}")
+                stage_timing.count("uploads_failed")
+                self.failed += 1
+                self._remove(job)
+                return
+            error = f"HTTP {response.status_code}"
+            retry_after = response.headers.get("Retry-After", "")
+        except (requests.RequestException, OSError) as e:
+            error = str(e)
+            retry_after = ""
+
+        job.attempts += 1
+        delay = min(RETRY_BASE_DELAY * 2 ** (job.attempts - 1), RETRY_MAX_DELAY)
+        if retry_after.isdigit():
+            # The relay's per-chat rate limit says when this chat may send again
+            delay = max(delay, min(int(retry_after), RETRY_MAX_DELAY))
+        job.next_attempt = time.time() + delay
+        self.retries += 1
+        stage_timing.count("upload_retries")
+        print(f"[{datetime.now()}] Failed to notify server ({error}); retry {job.attempts} in {delay}s")
+        self._save(job)
+        with self.condition:
+            heapq.heappush(self.jobs, job)
+            self.condition.notify()
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+    def close(self, timeout=5):
+        """Stop the workers; unsent jobs stay in the outbox for next time."""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.session.close()
+
+
+_uploader = None
+_uploader_lock = threading.Lock()
+
+
+def get_uploader():
+    """Return this process's uploader, starting it on first use."""
+    global _uploader
+    with _uploader_lock:
+        if _uploader is None:
+            _uploader = AlertUploader(os.path.join(OUTBOX_DIR, OUTBOX_NAME))
+            metrics.gauge("uploads_pending", "Alert uploads waiting in the outbox", _uploader.pending)
+        return _uploader